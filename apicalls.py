@@ -1,54 +1,175 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
+import sys
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Transient statuses worth retrying (the API restarting behind gunicorn, or overloaded)
+RETRY_STATUSES = (502, 503, 504)
+
+
+class JobError(Exception):
+    """A background job the API started failed or can no longer be found"""
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
 
 class APIClient:
-    def __init__(self, base_url="http://127.0.0.1:8000/"):
-        self.base_url = base_url
-        with open('config.json', 'r') as f:
-            self.config = json.load(f)
+    """Calls the model API over one pooled keep-alive session.
+
+    Independent calls run concurrently; each has a (connect, read) timeout and
+    connection errors and 502/503/504 responses are retried with exponential backoff.
+    """
+    def __init__(self, base_url=None):
+        self.config = settings.get_config()
+        self.base_url = base_url or self.config.get('api_base_url', "http://127.0.0.1:8000/")
         self.test_data_path = os.path.join(self.config['test_data_path'])
-        
+        self.timeout = (float(self.config.get('api_connect_timeout', 3.05)),
+                        float(self.config.get('api_read_timeout', 30)))
+        self.job_timeout = float(self.config.get('api_job_timeout', 120))
+        self.session = self._make_session(int(self.config.get('api_retries', 3)),
+                                          float(self.config.get('api_backoff_factor', 0.3)))
+
+    def _make_session(self, retries, backoff_factor):
+        retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(['GET', 'POST']),
+                      raise_on_status=False)
+        # One pooled connection per concurrent call
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=len(self.calls()))
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def _get(self, path):
+        return self.session.get(f'{self.base_url}{path}', timeout=self.timeout)
+
     def call_prediction(self):
-        return requests.post(
+        return self.session.post(
             f'{self.base_url}prediction',
-            json={'dataset_path': os.path.abspath(self.test_data_path)}
-        ).text
-        
+            json={'dataset_path': os.path.abspath(self.test_data_path)},
+            timeout=self.timeout
+        )
+
     def call_scoring(self):
-        return requests.get(f'{self.base_url}scoring').text
-        
+        return self._get('scoring')
+
     def call_summary_stats(self):
-        return requests.get(f'{self.base_url}summarystats').text
-        
+        return self._get('summarystats')
+
     def call_diagnostics(self):
-        return requests.get(f'{self.base_url}diagnostics').text
-        
+        response = self._get('diagnostics')
+        if response.status_code != 202:
+            return response
+        # No diagnostics computed yet: the API started a background job, wait for it
+        job_id = response.json()['job_id']
+        deadline = time.monotonic() + self.job_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.5)
+            job = self._get(f'diagnostics/jobs/{job_id}')
+            if job.status_code != 200:
+                # Unknown job: dropped from the API's job table, or the id is wrong
+                raise JobError(f"Diagnostics job {job_id} not found (HTTP {job.status_code})", job)
+            status = job.json().get('status')
+            if status == 'succeeded':
+                return self._get('diagnostics')
+            if status == 'failed':
+                raise JobError(f"Diagnostics job {job_id} failed: {job.json().get('error')}", job)
+        raise TimeoutError(f"Diagnostics job {job_id} did not finish within {self.job_timeout}s")
+
+    def calls(self):
+        return {
+            'prediction': self.call_prediction,
+            'scoring': self.call_scoring,
+            'summary_stats': self.call_summary_stats,
+            'diagnostics': self.call_diagnostics
+        }
+
+    def _timed_call(self, name, call):
+        start = time.perf_counter()
+        try:
+            response = call()
+            body = response.json()
+            latency = {'seconds': time.perf_counter() - start, 'status_code': response.status_code,
+                       'ok': response.ok}
+        except JobError as e:
+            logging.error(f"API call {name} failed: {e}")
+            body = {'error': str(e)}
+            latency = {'seconds': time.perf_counter() - start, 'status_code': e.response.status_code, 'ok': False}
+        except (requests.exceptions.RequestException, json.JSONDecodeError, TimeoutError, ValueError) as e:
+            logging.error(f"API call {name} failed: {e}")
+            body = {'error': str(e)}
+            latency = {'seconds': time.perf_counter() - start, 'status_code': None, 'ok': False}
+        return body, latency
+
     def run_all_calls(self):
         try:
-            responses = {
-                'prediction': json.loads(self.call_prediction()),
-                'scoring': json.loads(self.call_scoring()),
-                'summary_stats': json.loads(self.call_summary_stats()),
-                'diagnostics': json.loads(self.call_diagnostics())
-            }
-            
+            calls = self.calls()
+            start = time.perf_counter()
+            # The calls are independent, so total latency is the slowest call rather than the sum
+            with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix='apicall') as executor:
+                futures = {name: executor.submit(self._timed_call, name, call) for name, call in calls.items()}
+                results = {name: future.result() for name, future in futures.items()}
+
+            responses = {name: body for name, (body, _) in results.items()}
+            responses['latency'] = {name: latency for name, (_, latency) in results.items()}
+            responses['total_seconds'] = time.perf_counter() - start
+            for name, latency in responses['latency'].items():
+                logging.info(f"{name}: {latency['status_code']} in {latency['seconds']:.3f}s")
+
             output_path = os.path.join(self.config['output_model_path'], 'apireturns.txt')
             with open(output_path, 'w') as f:
                 json.dump(responses, f, indent=4)
-                
+
             return responses
-            
-        except requests.exceptions.RequestException as e:
-            print(f"API call failed: {e}")
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
+
         except Exception as e:
             print(f"An error occurred: {e}")
-            
-def main():
-    client = APIClient()
-    client.run_all_calls()
+
+
+# Function to serve the Flask app on a free local port for the duration of a block
+@contextmanager
+def local_server(host='127.0.0.1', port=0):
+    from werkzeug.serving import make_server
+    import app
+    server = make_server(host, port, app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='local-api', daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}/"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def run_calls(base_url=None):
+    client = APIClient(base_url)
+    try:
+        return client.run_all_calls()
+    finally:
+        client.close()
+
+
+def main(local=False):
+    if local:
+        with local_server() as base_url:
+            return run_calls(base_url)
+    return run_calls()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # --local runs the calls against the app served in-process instead of a running API
+    main(local='--local' in sys.argv[1:])
@@ -1,9 +1,17 @@
 from flask import Flask, session, jsonify, request
-import pandas as pd
 import numpy as np
 import pickle
-from diagnostics import model_predictions, dataframe_summary, execution_time, check_missing_data, outdated_packages_list
-from scoring import score_model
+import hashlib
+import threading
+import time
+import queue
+from collections import namedtuple
+from concurrent.futures import Future
+import inference
+import model_store
+import manifests
+import settings
+from jobs import JobRunner
 import json
 import os
 
@@ -13,15 +21,273 @@ import os
 app = Flask(__name__)
 app.secret_key = '1652d576-484a-49fd-913a-6879acfa6ba4'
 
-with open('config.json','r') as f:
-    config = json.load(f) 
+# diagnostics, scoring and drift pull in pandas; they are imported by the endpoints that use them
+config = settings.get_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path'])
 test_data_path = os.path.join(config['test_data_path'])
 prod_deployment_path = os.path.join(config['prod_deployment_path'])
 output_model_path = os.path.join(config['output_model_path']) 
+max_batch_size = int(config.get('max_batch_size', 10000))
+batch_window_ms = float(config.get('batch_window_ms', 2))
+batch_max_rows = int(config.get('batch_max_rows', 64))
+diagnostics_max_age = float(config.get('diagnostics_max_age', 300))
 
-prediction_model = None
+# Bounded pool for slow diagnostics work, kept off the request threads; the job table is a
+# file next to the model so every gunicorn worker shares one run and its result
+diagnostics_jobs = JobRunner(max_workers=int(config.get('diagnostics_workers', 2)),
+                             state_path=os.path.join(output_model_path, 'diagnosticsjobs.json'))
+
+FEATURE_COLUMNS = inference.FEATURE_COLUMNS
+
+# Immutable view of one loaded model; handlers keep a reference for the whole request
+# (arrays is None when no verified NumPy artifact was deployed with the pickle)
+ModelSnapshot = namedtuple('ModelSnapshot', ['version', 'model', 'arrays', 'loaded_at'])
+
+
+class ModelRegistry:
+    """Process-wide holder for the deployed model, hot-reloaded when the pickle changes.
+
+    When a versioned model store is deployed, the version its CURRENT pointer
+    names is served instead (arrays memory-mapped), and flipping the pointer
+    swaps the model.
+    """
+    def __init__(self, model_path, arrays_path=None, store=None):
+        self.model_path = model_path
+        self.arrays_path = arrays_path
+        self.store = store
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stat_key = None
+
+    def _current_stat_key(self):
+        # size + mtime + inode is a cheap change detector; the content hash is only
+        # computed when this key moves
+        if self.store:
+            current_path = os.path.join(self.store, model_store.CURRENT_FILE)
+            if os.path.exists(current_path):
+                stat = os.stat(current_path)
+                return ('store', stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        stat = os.stat(self.model_path)
+        key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        if self.arrays_path and os.path.exists(self.arrays_path):
+            arrays_stat = os.stat(self.arrays_path)
+            key += (arrays_stat.st_size, arrays_stat.st_mtime_ns, arrays_stat.st_ino)
+        return key
+
+    def _checked_arrays(self, arrays, model):
+        # Only use an array artifact if it describes exactly this model
+        expected = inference.model_to_arrays(model)
+        if (arrays.feature_columns != expected.feature_columns
+                or not np.array_equal(arrays.classes, expected.classes)
+                or not np.allclose(arrays.coef, expected.coef, rtol=0, atol=1e-12)
+                or not np.isclose(arrays.intercept, expected.intercept, rtol=0, atol=1e-12)):
+            print("Warning: model arrays do not match the deployed pickle, using sklearn")
+            return None
+        return arrays
+
+    def _load_arrays(self, model):
+        if not self.arrays_path or not os.path.exists(self.arrays_path):
+            return None
+        try:
+            expected = manifests.expected_checksum(os.path.dirname(self.arrays_path), os.path.basename(self.arrays_path))
+            if expected is not None and manifests.file_sha256(self.arrays_path) != expected:
+                print(f"Warning: checksum mismatch for {self.arrays_path}, using sklearn")
+                return None
+            return self._checked_arrays(inference.load_model_arrays(self.arrays_path), model)
+        except Exception as e:
+            print(f"Warning: ignoring model arrays: {str(e)}")
+            return None
+
+    def _reload_from_store(self, stat_key):
+        store_version = model_store.current_version(self.store)
+        # Refuse a version whose files don't match its manifest
+        manifest = model_store.verify(self.store, store_version)
+        version = manifest['model_sha256']
+        if self._snapshot is not None and self._snapshot.version == version:
+            model = self._snapshot.model
+        else:
+            model = model_store.load_model(self.store, store_version)
+        try:
+            arrays = self._checked_arrays(model_store.load_arrays(self.store, store_version), model)
+        except Exception as e:
+            print(f"Warning: ignoring model arrays: {str(e)}")
+            arrays = None
+        self._snapshot = ModelSnapshot(version, model, arrays, time.time())
+        self._stat_key = stat_key
+        print(f"Debug: Loaded model version {version[:12]} from {self.store} ({store_version})")
+
+    def _reload(self, stat_key):
+        if stat_key[0] == 'store':
+            self._reload_from_store(stat_key)
+            return
+
+        with open(self.model_path, 'rb') as f:
+            payload = f.read()
+        version = hashlib.sha256(payload).hexdigest()
+
+        # Refuse a pickle that doesn't match the checksum deployment recorded for it
+        expected = manifests.expected_checksum(os.path.dirname(self.model_path), os.path.basename(self.model_path))
+        if expected is not None and version != expected:
+            raise ValueError(f"Checksum mismatch for {self.model_path}, refusing to load")
+
+        # Same bytes re-published (e.g. a touch or an identical copy): keep the loaded model
+        # and only re-check the array artifact
+        if self._snapshot is not None and self._snapshot.version == version:
+            model = self._snapshot.model
+        else:
+            model = pickle.loads(payload)
+        arrays = self._load_arrays(model)
+        # Swapping a single reference is atomic; requests already holding the old
+        # snapshot finish on it
+        self._snapshot = ModelSnapshot(version, model, arrays, time.time())
+        self._stat_key = stat_key
+        print(f"Debug: Loaded model version {version[:12]} from {self.model_path}")
+
+    def get(self):
+        """Return the current ModelSnapshot, reloading first if the file has changed"""
+        try:
+            stat_key = self._current_stat_key()
+        except OSError:
+            if self._snapshot is None:
+                raise
+            return self._snapshot
+
+        if stat_key != self._stat_key:
+            with self._lock:
+                if stat_key != self._stat_key:
+                    try:
+                        self._reload(stat_key)
+                    except Exception as e:
+                        # A half-written or unreadable file must not take down serving;
+                        # the stat key is left unchanged so the next request retries
+                        if self._snapshot is None:
+                            raise
+                        print(f"Error reloading model, keeping version {self._snapshot.version[:12]}: {str(e)}")
+        return self._snapshot
+
+
+model_registry = ModelRegistry(
+    os.path.join(prod_deployment_path, config['output_model_file']),
+    os.path.join(prod_deployment_path, inference.ARRAYS_FILE),
+    model_store.store_path(prod_deployment_path)
+)
+
+
+def score_matrix(snapshot, X):
+    """Positive-class probabilities and labels for X, via the NumPy fast path when available"""
+    if snapshot.arrays is not None:
+        return inference.predict_proba(snapshot.arrays, X), inference.predict(snapshot.arrays, X)
+    model = snapshot.model
+    positive_index = list(model.classes_).index(1)
+    return model.predict_proba(X)[:, positive_index], model.predict(X)
+
+# Load the model once at startup so the first request doesn't pay for unpickling
+try:
+    model_registry.get()
+except Exception as e:
+    print(f"Warning: no model loaded at startup: {str(e)}")
+
+
+def _histogram_bucket(value):
+    # Power-of-two upper bounds: 1, 2, 4, 8, ...
+    bound = 1
+    while bound < value:
+        bound *= 2
+    return str(bound)
+
+
+class PredictionBatcher:
+    """Coalesces concurrent single-record predictions into one model call.
+
+    Requests are queued; a worker thread takes the first waiting request, keeps
+    collecting for up to ``window_ms`` or ``max_rows`` rows, then stacks them into
+    one NumPy batch and resolves every caller's future from the shared result.
+    """
+    def __init__(self, registry, window_ms=2.0, max_rows=64):
+        self.registry = registry
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._queue_depths = {}
+        self._batches = 0
+        self._requests = 0
+
+    def _ensure_started(self):
+        # Started lazily so gunicorn workers forked from a preloaded app each get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                    self._thread.start()
+
+    def submit(self, row):
+        """Queue one feature row; the returned Future resolves to (version, label, probability)"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Queue depth as seen when a batch starts forming, including the request just taken
+        depth = self._queue.qsize() + 1
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch, depth
+
+    def _record(self, batch_size, depth):
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += batch_size
+            size_bucket = _histogram_bucket(batch_size)
+            depth_bucket = _histogram_bucket(depth)
+            self._batch_sizes[size_bucket] = self._batch_sizes.get(size_bucket, 0) + 1
+            self._queue_depths[depth_bucket] = self._queue_depths.get(depth_bucket, 0) + 1
+
+    def _run(self):
+        while True:
+            batch, depth = self._collect()
+            self._record(len(batch), depth)
+            futures = [future for _, future in batch]
+            try:
+                X = np.vstack([row for row, _ in batch])
+                snapshot = self.registry.get()
+                probabilities, predictions = score_matrix(snapshot, X)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for i, future in enumerate(futures):
+                future.set_result((snapshot.version, predictions[i].item(), probabilities[i].item()))
+
+    def stats(self):
+        """Current queue depth plus batch-size and queue-depth histograms (power-of-two buckets)"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'requests': self._requests,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(self._batch_sizes),
+                'queue_depth_histogram': dict(self._queue_depths),
+                'window_ms': self.window * 1000.0,
+                'max_rows': self.max_rows
+            }
+
+
+prediction_batcher = PredictionBatcher(model_registry, window_ms=batch_window_ms, max_rows=batch_max_rows)
 
 
 # Prediction Endpoint
@@ -40,16 +306,141 @@ def predict():
     
     try:
         # read data and make predictions using imported model_predictions function
-        predictions = model_predictions(dataset_path, prod_deployment_path)
+        from diagnostics import model_predictions
+        snapshot = model_registry.get()
+        predictions = model_predictions(dataset_path, prod_deployment_path, model=snapshot.model, arrays=snapshot.arrays)
         if predictions is None:
             return jsonify({"error": "Failed to generate predictions"}), 500
         # Convert predictions to list if it's numpy array, or keep as list if already list
         pred_list = predictions.tolist() if hasattr(predictions, 'tolist') else list(predictions)
-        return jsonify(pred_list)
+        response = jsonify(pred_list)
+        response.headers['X-Model-Version'] = snapshot.version
+        return response
     except Exception as e:
         print(f"Error in prediction: {str(e)}")
         return jsonify({"error": f"Prediction error: {str(e)}"}), 500
 
+class BatchTooLargeError(ValueError):
+    pass
+
+
+def _is_number(value):
+    # JSON numbers only: numeric strings and booleans would otherwise be coerced by NumPy
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_numbers(columns):
+    """Raise ValueError naming the first non-numeric value in each {column: values} entry"""
+    for column, values in columns.items():
+        for i, value in enumerate(values):
+            if not _is_number(value):
+                raise ValueError(f"Feature values must be numbers: {column} of record {i} is {json.dumps(value)}")
+
+
+def records_to_matrix(payload, max_rows=max_batch_size):
+    """Turn an inline JSON payload into an (n_rows, n_features) float matrix.
+
+    Accepts either a list of records ``[{feature: value, ...}, ...]`` (optionally
+    wrapped as ``{"records": [...]}``) or a columnar payload ``{feature: [values], ...}``.
+    """
+    if isinstance(payload, dict) and 'records' in payload:
+        payload = payload['records']
+
+    if isinstance(payload, list):
+        n_rows = len(payload)
+        if n_rows > max_rows:
+            raise BatchTooLargeError(f"Batch of {n_rows} records exceeds max_batch_size={max_rows}")
+        for i, record in enumerate(payload):
+            if not isinstance(record, dict):
+                raise ValueError(f"Each record must be an object with keys {FEATURE_COLUMNS}: record {i} is {json.dumps(record)}")
+            missing = [column for column in FEATURE_COLUMNS if column not in record]
+            if missing:
+                raise ValueError(f"Each record must be an object with keys {FEATURE_COLUMNS}: record {i} is missing {missing}")
+        rows = [[record[column] for column in FEATURE_COLUMNS] for record in payload]
+        _check_numbers({column: [row[j] for row in rows] for j, column in enumerate(FEATURE_COLUMNS)})
+        X = np.array(rows, dtype=np.float64).reshape(n_rows, len(FEATURE_COLUMNS))
+    elif isinstance(payload, dict):
+        missing = [column for column in FEATURE_COLUMNS if column not in payload]
+        if missing:
+            raise ValueError(f"Columnar payload is missing columns: {missing}")
+        not_lists = [column for column in FEATURE_COLUMNS if not isinstance(payload[column], list)]
+        if not_lists:
+            raise ValueError(f"Columnar payload values must be lists: {not_lists}")
+        lengths = {len(payload[column]) for column in FEATURE_COLUMNS}
+        if len(lengths) != 1:
+            raise ValueError("All columns in a columnar payload must have the same length")
+        n_rows = lengths.pop()
+        if n_rows > max_rows:
+            raise BatchTooLargeError(f"Batch of {n_rows} records exceeds max_batch_size={max_rows}")
+        _check_numbers({column: payload[column] for column in FEATURE_COLUMNS})
+        X = np.column_stack([np.asarray(payload[column], dtype=np.float64) for column in FEATURE_COLUMNS])
+        X = X.reshape(n_rows, len(FEATURE_COLUMNS))
+    else:
+        raise ValueError("Payload must be a list of records or a columnar object")
+
+    if n_rows == 0:
+        raise ValueError("Payload contains no records")
+    # Python's JSON parser accepts NaN and Infinity literals; the model can't score them
+    if not np.isfinite(X).all():
+        raise ValueError(f"Feature values must be finite numbers: {FEATURE_COLUMNS}")
+    return X
+
+
+# Batch Prediction Endpoint: scores inline records without touching the filesystem
+@app.route("/prediction/batch", methods=['POST'])
+def predict_batch():
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({"error": "A JSON body is required"}), 400
+
+    try:
+        X = records_to_matrix(payload)
+    except BatchTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        snapshot = model_registry.get()
+        # Probability of the positive (churn) class plus the model's own labels
+        probabilities, predictions = score_matrix(snapshot, X)
+        return jsonify({
+            'model_version': snapshot.version,
+            'probabilities': probabilities.tolist(),
+            'predictions': predictions.tolist()
+        })
+    except Exception as e:
+        print(f"Error in batch prediction: {str(e)}")
+        return jsonify({"error": f"Prediction error: {str(e)}"}), 500
+
+# Single-record Prediction Endpoint: coalesced with concurrent callers by the batcher
+@app.route("/prediction/record", methods=['POST'])
+def predict_record():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "A JSON object with one record is required"}), 400
+
+    try:
+        X = records_to_matrix([payload], max_rows=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        version, prediction, probability = prediction_batcher.submit(X[0]).result(timeout=30)
+        return jsonify({
+            'model_version': version,
+            'probability': probability,
+            'prediction': prediction
+        })
+    except Exception as e:
+        print(f"Error in record prediction: {str(e)}")
+        return jsonify({"error": f"Prediction error: {str(e)}"}), 500
+
+# Batcher Statistics Endpoint: for tuning batch_window_ms / batch_max_rows
+@app.route("/prediction/stats", methods=['GET'])
+def prediction_stats():
+    return jsonify(prediction_batcher.stats())
+
 # Scoring Endpoint
 @app.route("/scoring", methods=['GET'])  # Changed from @app.get to @app.route with methods
 def scoring():        
@@ -66,7 +457,9 @@ def scoring():
         if not os.path.exists(model_path):
             return jsonify({"error": f"Model not found at {model_path}"}), 404
             
-        score = score_model(model_path, test_path)
+        from scoring import score_model
+        snapshot = model_registry.get()
+        score = score_model(model_path, test_path, model=snapshot.model)
         print(f"Debug: Calculated score: {score}")
         
         if score is None:
@@ -74,7 +467,9 @@ def scoring():
         
         try:
             score_value = float(score)
-            return jsonify({'F1 score': score_value})
+            response = jsonify({'F1 score': score_value})
+            response.headers['X-Model-Version'] = snapshot.version
+            return response
         except (ValueError, TypeError) as e:
             return jsonify({"error": f"Invalid score format: {score}. Error: {str(e)}"}), 500
             
@@ -87,27 +482,72 @@ def scoring():
 def summary_stats():        
     try:
         # Read data from production deployment path and calculate statistics
+        from diagnostics import dataframe_summary
         summary = dataframe_summary(dataset_csv_path)
         return jsonify(summary)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
-# Diagnostics Endpoint
+# Drift Endpoint: the pipeline drift gate's last report on a new batch against the deployed reference
+@app.route("/drift", methods=['GET','OPTIONS'])
+def drift_scores():
+    import drift
+    # The consolidated dataset still holds the reference rows, so re-checking it here would
+    # dilute a shift the gate saw in the new batch; the gate's own report is served instead
+    report_path = os.path.join(output_model_path, drift.REPORT_FILE)
+    if not os.path.exists(report_path):
+        return jsonify({"error": "No drift check has run yet"}), 404
+    try:
+        return jsonify(drift.load_report(report_path))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+def run_diagnostics():
+    from diagnostics import execution_time, check_missing_data, outdated_packages_list
+    timing = execution_time()
+    missing = check_missing_data(dataset_csv_path)
+    dependencies = outdated_packages_list()
+    
+    return {
+        'execution_time': timing,
+        'missing_data': missing,
+        'dependency_check': dependencies
+    }
+
+# Diagnostics Endpoint: answers from the latest background run without waiting
 @app.route("/diagnostics", methods=['GET','OPTIONS'])
 def diagnostics():        
     try:
-        timing = execution_time()
-        missing = check_missing_data(dataset_csv_path)
-        dependencies = outdated_packages_list()
-        
-        diagnostic_info = {
-            'execution_time': timing,
-            'missing_data': missing,
-            'dependency_check': dependencies
-        }
+        latest = diagnostics_jobs.latest('diagnostics')
+        if latest is None:
+            # Nothing computed yet: start (or join) a run and tell the caller where to poll
+            job = diagnostics_jobs.submit('diagnostics', run_diagnostics)
+            return jsonify({'status': job['status'], 'job_id': job['job_id']}), 202
+
+        # Refresh in the background once the cached result is too old
+        if latest['age_seconds'] > diagnostics_max_age:
+            diagnostics_jobs.submit('diagnostics', run_diagnostics)
+
+        diagnostic_info = dict(latest['result'])
+        diagnostic_info['age_seconds'] = latest['age_seconds']
+        diagnostic_info['job_id'] = latest['job_id']
         return jsonify(diagnostic_info)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# Diagnostics Jobs Endpoint: start a fresh run, or join the one already in flight
+@app.route("/diagnostics/jobs", methods=['POST'])
+def submit_diagnostics_job():
+    job = diagnostics_jobs.submit('diagnostics', run_diagnostics)
+    return jsonify(job), 202
+
+# Diagnostics Job Status Endpoint
+@app.route("/diagnostics/jobs/<job_id>", methods=['GET'])
+def diagnostics_job_status(job_id):
+    job = diagnostics_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
+
 if __name__ == "__main__":    
     app.run(host='0.0.0.0', port=8000, debug=True, threaded=True)
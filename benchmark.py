@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+import logging
+import settings
+from datetime import datetime
+import numpy as np
+import ingestion
+import training
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Benchmark history, one JSON object per run, kept next to the trained model
+HISTORY_FILE = 'benchmarkhistory.jsonl'
+
+# A stage is flagged when its median wall time exceeds the recent baseline by this factor
+REGRESSION_THRESHOLD = 1.25
+
+# Number of previous runs the baseline is taken from
+BASELINE_RUNS = 5
+
+# Entry points whose cold-start import time is tracked: the cron run and the gunicorn worker boot
+IMPORT_TARGETS = ['fullprocess', 'app']
+
+
+def summarize(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'min': float(samples.min()),
+        'median': float(np.median(samples)),
+        'p95': float(np.percentile(samples, 95))
+    }
+
+
+# Function to time one stage in-process
+def measure(fn, repetitions=5, warmup=1, setup=None):
+    """Run fn ``warmup`` times untimed, then ``repetitions`` times timed.
+
+    ``setup`` runs before every call and is not timed (e.g. to reset scratch
+    data). Peak memory comes from one extra run under tracemalloc, so its
+    overhead doesn't distort the timings.
+    """
+    def run():
+        if setup is not None:
+            setup()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        fn()
+        return time.perf_counter() - start_wall, time.process_time() - start_cpu
+
+    for _ in range(warmup):
+        run()
+
+    wall_times = []
+    cpu_times = []
+    for _ in range(repetitions):
+        wall, cpu = run()
+        wall_times.append(wall)
+        cpu_times.append(cpu)
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repetitions': repetitions,
+        'wall_seconds': summarize(wall_times),
+        'cpu_seconds': summarize(cpu_times),
+        'peak_memory_mb': peak / (1024 * 1024)
+    }
+
+
+def read_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(result, history, threshold=REGRESSION_THRESHOLD):
+    """Stages whose median wall time is above threshold x the median of the last BASELINE_RUNS runs"""
+    regressions = []
+    for stage, stats in result['stages'].items():
+        previous = [run['stages'][stage]['wall_seconds']['median'] for run in history[-BASELINE_RUNS:]
+                    if 'wall_seconds' in run.get('stages', {}).get(stage, {})]
+        if not previous or 'wall_seconds' not in stats:
+            continue
+        baseline = float(np.median(previous))
+        current = stats['wall_seconds']['median']
+        if current > baseline * threshold:
+            regressions.append({'stage': stage, 'baseline_median': baseline, 'median': current})
+    return regressions
+
+
+# Function to benchmark ingestion and training against a scratch copy of the data
+def benchmark_pipeline(config, repetitions=5, warmup=1, history_path=None):
+    """Time each pipeline stage in-process without touching the real data or model.
+
+    Source files and the ingested dataset are copied to a temporary workspace;
+    ingestion output is reset before every run so each one does the same work.
+    The result is appended to the history file and compared to earlier runs.
+    """
+    if history_path is None:
+        history_path = os.path.join(config['output_model_path'], HISTORY_FILE)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        source_path = os.path.join(scratch, 'source')
+        ingested_path = os.path.join(scratch, 'ingested')
+        pristine_path = os.path.join(scratch, 'ingested_pristine')
+        model_path = os.path.join(scratch, 'models', config['output_model_file'])
+        shutil.copytree(config['input_folder_path'], source_path)
+        shutil.copytree(config['output_folder_path'], pristine_path)
+        os.makedirs(os.path.dirname(model_path))
+
+        dataframe_path = os.path.join(ingested_path, config['output_data_file'])
+
+        def reset_ingested():
+            shutil.rmtree(ingested_path, ignore_errors=True)
+            shutil.copytree(pristine_path, ingested_path)
+
+        def run_ingestion():
+            ingestion.ingest_data(
+                source_path, ingested_path, dataframe_path,
+                os.path.join(ingested_path, 'ingestedfiles.txt'),
+                mode=config.get('ingestion_mode', 'full'),
+                data_format=config.get('dataset_format', 'csv'),
+                csv_export=config.get('csv_export', True),
+                chunk_size=config.get('chunk_size', 100000),
+                seen_set_limit=config.get('seen_set_limit', 2000000),
+                workers=config.get('ingestion_workers', 1),
+                csv_engine=config.get('csv_engine', 'c')
+            )
+
+        def run_training():
+            if training.train_model(dataframe_path, model_path, config['output_data_file'],
+                                    config['output_model_file']) is None:
+                raise RuntimeError("train_model failed")
+
+        stages = [
+            ('ingestion', run_ingestion, reset_ingested),
+            ('training', run_training, None)
+        ]
+
+        result = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'repetitions': repetitions,
+            'warmup': warmup,
+            'stages': {}
+        }
+        reset_ingested()
+        for name, fn, setup in stages:
+            logging.info(f"Benchmarking {name} ({warmup} warmup, {repetitions} timed runs)...")
+            try:
+                result['stages'][name] = measure(fn, repetitions, warmup, setup)
+            except Exception as e:
+                logging.error(f"Benchmark of {name} failed: {str(e)}")
+                result['stages'][name] = {'error': str(e)}
+
+    history = read_history(history_path)
+    result['regressions'] = find_regressions(result, history)
+    for regression in result['regressions']:
+        logging.warning(
+            f"Regression in {regression['stage']}: median {regression['median']:.3f}s "
+            f"vs baseline {regression['baseline_median']:.3f}s"
+        )
+
+    os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    return result
+
+
+def _run_interpreter(code, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    start = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}")
+    return elapsed, completed.stderr
+
+
+def slowest_imports(importtime_output, top=10):
+    """Top-level packages by cumulative import time, from python -X importtime output"""
+    entries = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by indentation; only modules imported directly by the target are kept
+        if name.startswith('  '):
+            continue
+        entries.append({'module': name.strip(), 'cumulative_seconds': int(cumulative) / 1e6})
+    return sorted(entries, key=lambda entry: entry['cumulative_seconds'], reverse=True)[:top]
+
+
+# Function to time cold imports of an entry point in fresh interpreters
+def measure_import(module, repetitions=5):
+    """Wall time of a new interpreter importing module (what cron and a worker boot pay).
+
+    The bare interpreter start-up is measured separately so the import's own
+    share is visible, and one -X importtime run names the slowest imports.
+    """
+    interpreter = [_run_interpreter('pass')[0] for _ in range(repetitions)]
+    samples = [_run_interpreter(f'import {module}')[0] for _ in range(repetitions)]
+    _, trace = _run_interpreter(f'import {module}', importtime=True)
+    return {
+        'repetitions': repetitions,
+        'wall_seconds': summarize(samples),
+        'interpreter_seconds': summarize(interpreter),
+        'slowest_imports': slowest_imports(trace)
+    }
+
+
+def benchmark_imports(config, modules=IMPORT_TARGETS, repetitions=5, history_path=None):
+    """Cold-start import time of each entry point, recorded in the benchmark history"""
+    if history_path is None:
+        history_path = os.path.join(config['output_model_path'], HISTORY_FILE)
+
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'repetitions': repetitions,
+        'stages': {}
+    }
+    for module in modules:
+        logging.info(f"Timing cold import of {module} ({repetitions} runs)...")
+        try:
+            result['stages'][f'import:{module}'] = measure_import(module, repetitions)
+        except Exception as e:
+            logging.error(f"Import benchmark of {module} failed: {str(e)}")
+            result['stages'][f'import:{module}'] = {'error': str(e)}
+
+    history = read_history(history_path)
+    result['regressions'] = find_regressions(result, history)
+    for regression in result['regressions']:
+        logging.warning(
+            f"Regression in {regression['stage']}: median {regression['median']:.3f}s "
+            f"vs baseline {regression['baseline_median']:.3f}s"
+        )
+
+    os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    return result
+
+
+if __name__ == '__main__':
+    config = settings.get_config()
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'imports':
+        repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else config.get('benchmark_repetitions', 5)
+        print(json.dumps(benchmark_imports(config, repetitions=repetitions), indent=4))
+    else:
+        repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else config.get('benchmark_repetitions', 5)
+        print(json.dumps(benchmark_pipeline(config, repetitions=repetitions), indent=4))
@@ -0,0 +1,143 @@
+import os
+import shutil
+import hashlib
+import logging
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Supported storage formats for the consolidated dataset (config.json: dataset_format)
+DATASET_FORMATS = ('csv', 'parquet')
+
+# Compression used for Parquet part files
+PARQUET_COMPRESSION = 'zstd'
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def parquet_path(dataframe_path):
+    """Parquet location for a dataset whose CSV lives at dataframe_path (finaldata.csv -> finaldata.parquet)"""
+    return os.path.splitext(dataframe_path)[0] + '.parquet'
+
+
+def _resolve_format(data_format):
+    if data_format not in DATASET_FORMATS:
+        raise ValueError(f"Unknown dataset format: {data_format}")
+    if data_format == 'parquet' and not parquet_available():
+        logging.warning("pyarrow is not installed, storing the dataset as CSV")
+        return 'csv'
+    return data_format
+
+
+def _parts(path):
+    return sorted(f for f in os.listdir(path) if f.endswith('.parquet'))
+
+
+def dataset_exists(dataframe_path, data_format='csv'):
+    if _resolve_format(data_format) == 'parquet':
+        path = parquet_path(dataframe_path)
+        return os.path.isdir(path) and bool(_parts(path))
+    return os.path.exists(dataframe_path)
+
+
+# Function to write the consolidated dataset
+def write_dataset(df, dataframe_path, data_format='csv', csv_export=True, append=False):
+    """Write (or append to) the dataset in the configured format.
+
+    Parquet datasets are a directory of compressed part files, so appends add a
+    part instead of rewriting history. With ``csv_export`` the CSV at
+    ``dataframe_path`` is kept up to date as well, for tools that expect it.
+    """
+    data_format = _resolve_format(data_format)
+
+    if data_format == 'parquet':
+        path = parquet_path(dataframe_path)
+        if append and os.path.isdir(path):
+            part = os.path.join(path, f"part-{len(_parts(path)):05d}.parquet")
+            df.to_parquet(part, index=False, compression=PARQUET_COMPRESSION)
+        else:
+            # Build the new dataset next to the old one, then swap it in
+            staging = path + '.tmp'
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            df.to_parquet(os.path.join(staging, 'part-00000.parquet'), index=False, compression=PARQUET_COMPRESSION)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(staging, path)
+        logging.info(f"Wrote {len(df)} rows to {path}")
+
+    if data_format == 'csv' or csv_export:
+        if append and os.path.exists(dataframe_path):
+            df.to_csv(dataframe_path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(dataframe_path, index=False)
+
+
+def staging_path(dataframe_path):
+    """Scratch location a dataset can be built at before publish_dataset() swaps it in"""
+    root, ext = os.path.splitext(dataframe_path)
+    return root + '.staging' + ext
+
+
+def publish_dataset(staged_path, dataframe_path, data_format='csv', csv_export=True):
+    """Move a dataset written at staged_path over the one at dataframe_path"""
+    data_format = _resolve_format(data_format)
+    if data_format == 'parquet':
+        target = parquet_path(dataframe_path)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(parquet_path(staged_path), target)
+    if data_format == 'csv' or csv_export:
+        os.replace(staged_path, dataframe_path)
+
+
+def dataset_fingerprint(dataframe_path, data_format='csv'):
+    """Cheap identity of the dataset read_dataset() would load, from file stats only"""
+    if _resolve_format(data_format) == 'parquet' and dataset_exists(dataframe_path, 'parquet'):
+        path = parquet_path(dataframe_path)
+        files = [os.path.join(path, part) for part in _parts(path)]
+    elif os.path.exists(dataframe_path):
+        files = [dataframe_path]
+    else:
+        return None
+    stats = []
+    for file_path in files:
+        stat = os.stat(file_path)
+        stats.append(f"{os.path.basename(file_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256('|'.join(stats).encode()).hexdigest()
+
+
+def dataset_columns(dataframe_path, data_format='csv'):
+    if _resolve_format(data_format) == 'parquet' and dataset_exists(dataframe_path, 'parquet'):
+        import pyarrow.parquet as pq
+        path = parquet_path(dataframe_path)
+        return list(pq.read_schema(os.path.join(path, _parts(path)[0])).names)
+    return list(pd.read_csv(dataframe_path, nrows=0).columns)
+
+
+# Function to read the consolidated dataset
+def read_dataset(dataframe_path, columns=None, numeric_only=False, data_format='csv'):
+    """Load the dataset, reading only ``columns`` (or only numeric columns) where the format allows.
+
+    Falls back to the CSV at ``dataframe_path`` when no Parquet dataset exists.
+    """
+    if _resolve_format(data_format) == 'parquet' and dataset_exists(dataframe_path, 'parquet'):
+        path = parquet_path(dataframe_path)
+        if numeric_only:
+            import pyarrow.parquet as pq
+            import pyarrow.types as pat
+            schema = pq.read_schema(os.path.join(path, _parts(path)[0]))
+            numeric = [field.name for field in schema
+                       if pat.is_integer(field.type) or pat.is_floating(field.type)]
+            columns = [c for c in (columns or numeric) if c in numeric]
+        return pd.read_parquet(path, columns=columns)
+
+    df = pd.read_csv(dataframe_path, usecols=columns)
+    if numeric_only:
+        df = df.select_dtypes(include='number')
+    return df
@@ -1,18 +1,112 @@
 import os
 import json
+import time
 import shutil
-import pandas as pd
 import numpy
 import pickle
 import logging
+import inference
+import dataset
+import drift
+import model_store
+import settings
+from manifests import DEPLOYMENT_MANIFEST, file_sha256
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def store_model_into_pickle(dataset_csv_path, output_model_path, prod_deployment_path):
+def _fsync_directory(path):
+    # Makes the rename itself durable; not every platform can open a directory
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def publish_staged(staged_path, destination_path, checksum=None):
+    """Move a fully written file into place atomically, unless the destination already has its content.
+
+    Returns the file's sha256. The staged file is fsynced before the rename, so
+    a reader sees either the old file or the complete new one.
+    """
+    if checksum is None:
+        checksum = file_sha256(staged_path)
+    if (os.path.exists(destination_path) and os.path.getsize(destination_path) == os.path.getsize(staged_path)
+            and file_sha256(destination_path) == checksum):
+        os.remove(staged_path)
+        logging.info(f"Unchanged, kept deployed copy: {os.path.basename(destination_path)}")
+        return checksum
+    with open(staged_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(staged_path, destination_path)
+    _fsync_directory(os.path.dirname(destination_path) or '.')
+    logging.info(f"Deployed {os.path.basename(destination_path)}")
+    return checksum
+
+def deploy_file(source_path, destination_path):
+    # Compare before copying, so an unchanged file is only read, never rewritten
+    checksum = file_sha256(source_path)
+    # The deployed copy itself is hashed: the manifest only says what was deployed, not what is there now
+    if (os.path.exists(destination_path) and os.path.getsize(destination_path) == os.path.getsize(source_path)
+            and file_sha256(destination_path) == checksum):
+        logging.info(f"Unchanged, kept deployed copy: {os.path.basename(destination_path)}")
+        return checksum
+    staged_path = destination_path + '.tmp'
+    shutil.copyfile(source_path, staged_path)
+    return publish_staged(staged_path, destination_path, checksum)
+
+def write_deployment_manifest(prod_deployment_path, checksums):
+    manifest = {
+        'deployed_at': time.time(),
+        'files': {
+            name: {'sha256': checksum, 'size': os.path.getsize(os.path.join(prod_deployment_path, name))}
+            for name, checksum in sorted(checksums.items())
+        }
+    }
+    staged_path = os.path.join(prod_deployment_path, DEPLOYMENT_MANIFEST + '.tmp')
+    with open(staged_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    publish_staged(staged_path, os.path.join(prod_deployment_path, DEPLOYMENT_MANIFEST))
+    return manifest
+
+def export_model_arrays(model_path, dataset_path, arrays_path, data_format='csv'):
+    """Write the model's arrays next to the pickle, verified against predict_proba on the dataset.
+
+    Returns the artifact's sha256, or None if it could not be exported.
+    """
+    try:
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        arrays = inference.model_to_arrays(model)
+
+        # Parity check on the ingested data before the artifact is published
+        X = inference.feature_matrix(dataset.read_dataset(dataset_path, columns=inference.FEATURE_COLUMNS,
+                                                          data_format=data_format))
+        max_diff = inference.check_parity(model, arrays, X)
+        logging.info(f"NumPy scorer parity check passed (max abs diff {max_diff:.2e})")
+
+        inference.export_model_arrays(model, arrays_path + '.tmp')
+        return publish_staged(arrays_path + '.tmp', arrays_path)
+    except Exception as e:
+        # Never leave arrays from a previous model next to a new pickle; the pickle stays
+        # deployed and consumers fall back to sklearn when the arrays are missing
+        logging.error(f"Skipping model array export: {str(e)}")
+        if os.path.exists(arrays_path):
+            os.remove(arrays_path)
+        return None
+
+def store_model_into_pickle(dataset_csv_path, output_model_path, prod_deployment_path, data_format=None):
     #copy the latest pickle file, the latestscore.txt value, and the ingestfiles.txt file into the deployment directory
+    #every file is staged, fsynced and renamed into place, and files whose content is unchanged are not rewritten
     try:
         logging.info("Starting the model deployment process...")
+        if data_format is None:
+            data_format = settings.get_config().get('dataset_format', 'csv')
 
         # Normalize and validate paths
         dataset_csv_path = os.path.normpath(dataset_csv_path) if dataset_csv_path else None
@@ -30,39 +124,83 @@ def store_model_into_pickle(dataset_csv_path, output_model_path, prod_deployment
 
         # Create deployment directory if it doesn't exist
         os.makedirs(prod_deployment_path, exist_ok=True)
+        checksums = {}
 
         # Copy the latest pickle file
-        pickle_files = [f for f in os.listdir(output_model_path) if f.endswith('.pkl')]
+        pickle_files = sorted(f for f in os.listdir(output_model_path) if f.endswith('.pkl'))
         if not pickle_files:
             raise FileNotFoundError("No pickle file found in output model directory")
         latest_pickle = pickle_files[0]
-        shutil.copy(
+        checksums[latest_pickle] = deploy_file(
             os.path.join(output_model_path, latest_pickle),
             os.path.join(prod_deployment_path, latest_pickle)
         )
-        logging.info(f"Copied latest pickle file: {latest_pickle}")
+
+        # Export the coefficients as a compact array artifact for the NumPy scorer
+        arrays_checksum = export_model_arrays(
+            os.path.join(prod_deployment_path, latest_pickle),
+            os.path.join(dataset_csv_path, 'finaldata.csv'),
+            os.path.join(prod_deployment_path, inference.ARRAYS_FILE),
+            data_format
+        )
+        if arrays_checksum is not None:
+            checksums[inference.ARRAYS_FILE] = arrays_checksum
+
+        # Reference histograms of the data the model was trained on, for drift detection
+        try:
+            reference_path = os.path.join(prod_deployment_path, drift.REFERENCE_FILE)
+            drift.save_reference(os.path.join(dataset_csv_path, 'finaldata.csv'), reference_path + '.tmp',
+                                 data_format=data_format)
+            checksums[drift.REFERENCE_FILE] = publish_staged(reference_path + '.tmp', reference_path)
+        except Exception as e:
+            logging.error(f"Skipping drift reference: {str(e)}")
 
         # Copy the latestscore.txt
-        score_files = [f for f in os.listdir(output_model_path) if f.endswith('.txt')]
-        if not score_files:
+        latest_score = 'latestscore.txt'
+        if not os.path.exists(os.path.join(output_model_path, latest_score)):
             raise FileNotFoundError("No score file found in output model directory")
-        latest_score = score_files[0]
-        shutil.copy(
+        checksums[latest_score] = deploy_file(
             os.path.join(output_model_path, latest_score),
             os.path.join(prod_deployment_path, latest_score)
         )
-        logging.info(f"Copied latest score file: {latest_score}")
+
+        # Copy the training state the next incremental training run starts from
+        for state_file in ['trainedrows.npy', 'trainingstate.json']:
+            if os.path.exists(os.path.join(output_model_path, state_file)):
+                checksums[state_file] = deploy_file(
+                    os.path.join(output_model_path, state_file),
+                    os.path.join(prod_deployment_path, state_file)
+                )
+            elif os.path.exists(os.path.join(prod_deployment_path, state_file)):
+                # A full-mode model has no row bookkeeping; don't leave the previous model's next to it
+                os.remove(os.path.join(prod_deployment_path, state_file))
 
         # Copy the ingestfiles.txt
-        ingest_files = [f for f in os.listdir(dataset_csv_path) if f.endswith('.txt')]
-        if not ingest_files:
+        ingest_file = 'ingestedfiles.txt'
+        if not os.path.exists(os.path.join(dataset_csv_path, ingest_file)):
             raise FileNotFoundError("No ingest file found in dataset directory")
-        ingest_file = ingest_files[0]
-        shutil.copy(
+        checksums[ingest_file] = deploy_file(
             os.path.join(dataset_csv_path, ingest_file),
             os.path.join(prod_deployment_path, ingest_file)
         )
-        logging.info(f"Copied ingest file: {ingest_file}")
+
+        # Written last: readers verify the files above against it
+        write_deployment_manifest(prod_deployment_path, checksums)
+
+        # Publish the model as a version in the store and flip the live pointer to it
+        store = model_store.store_path(prod_deployment_path)
+        with open(os.path.join(prod_deployment_path, latest_score), 'r') as f:
+            metrics = {'f1': float(f.read().strip())}
+        # The other model-specific files go into the version as well, so a rollback restores them
+        model_files = [os.path.join(prod_deployment_path, name) for name in sorted(checksums)
+                       if name not in (latest_pickle, ingest_file)]
+        version = model_store.publish(
+            os.path.join(prod_deployment_path, latest_pickle), store, metrics=metrics,
+            data_fingerprint=dataset.dataset_fingerprint(os.path.join(dataset_csv_path, 'finaldata.csv'), data_format),
+            extra_files=model_files
+        )
+        if model_store.current_version(store) != version:
+            model_store.activate(store, version)
 
         logging.info("Model deployment completed successfully")
         return True
@@ -77,8 +215,7 @@ if __name__ == '__main__':
         if not os.path.exists('config.json'):
             raise FileNotFoundError("config.json not found in current directory")
             
-        with open('config.json', 'r') as f:
-            config = json.load(f)
+        config = settings.get_config()
             
         required_keys = ['output_folder_path', 'output_model_path', 'prod_deployment_path']
         if not all(key in config and config[key] for key in required_keys):
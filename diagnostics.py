@@ -1,120 +1,304 @@
 import pandas as pd
 import numpy as np
-import timeit
 import os
 import json
 import pickle
-import subprocess
+import re
 import sys
+import time
+import importlib.metadata
 import logging
+import inference
+import evaluation
+import dataset
+import summarystats
+import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load config.json and get environment variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = settings.get_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 test_data_path = os.path.join(config['test_data_path'])
 prod_deployment_path = os.path.join(config['prod_deployment_path']) 
+dataset_format = config.get('dataset_format', 'csv')
 
 
 # Function to get model predictions
-def model_predictions(test_data_path=test_data_path, prod_deployment_path=prod_deployment_path):
-    logging.info("Loading model for predictions...")
-    # Load the model
-    model_path = os.path.join(prod_deployment_path, "trainedmodel.pkl")
-    with open(model_path, 'rb') as f:
-        model = pickle.load(f)
-    
-    logging.info("Loading test data...")
-    # Load test data
-    test_data = pd.read_csv(os.path.join(test_data_path, "testdata.csv"))
-    X = test_data.drop(['corporation', 'exited'], axis=1)
+def model_predictions(test_data_path=test_data_path, prod_deployment_path=prod_deployment_path, model=None, arrays=None):
+    # Callers that already hold a loaded model (e.g. the API's model registry) skip the unpickle;
+    # otherwise the deployed array artifact is preferred over the pickle
+    if model is None and arrays is None:
+        arrays_path = os.path.join(prod_deployment_path, inference.ARRAYS_FILE)
+        if os.path.exists(arrays_path):
+            logging.info("Loading model arrays for predictions...")
+            arrays = inference.load_model_arrays(arrays_path)
+        else:
+            logging.info("Loading model for predictions...")
+            # Load the model
+            model_path = os.path.join(prod_deployment_path, "trainedmodel.pkl")
+            with open(model_path, 'rb') as f:
+                model = pickle.load(f)
     
+    if arrays is None:
+        arrays = inference.model_to_arrays(model)
+
     logging.info("Generating predictions...")
-    # Generate predictions
-    predictions = model.predict(X)
+    # Generate predictions (shared with scoring and reporting through the evaluation cache)
+    predictions = evaluation.evaluate(arrays, os.path.join(test_data_path, "testdata.csv")).predictions
     return predictions.tolist()
 
 
+# In-process profile per dataset fingerprint, shared by the summary and missing-data checks
+_profile_cache = {}
+
+
+def _sorted_quantile(sorted_block, valid_counts, q):
+    # Linear-interpolated quantile per column of a column-sorted block whose NaNs sit at the end
+    positions = (valid_counts - 1).clip(min=0) * q
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    columns = np.arange(sorted_block.shape[1])
+    low_values = sorted_block[lower, columns]
+    high_values = sorted_block[upper, columns]
+    result = low_values + (high_values - low_values) * (positions - lower)
+    return np.where(valid_counts > 0, result, np.nan)
+
+
+# Function to profile a dataframe in one vectorized pass
+def profile_dataframe(df):
+    """Data-quality profile of df computed over a single NumPy block.
+
+    NA fractions cover every column; mean, median, std, min/max, quartiles,
+    cardinality and IQR outlier counts cover the numeric columns. The block is
+    sorted once and median, quartiles and cardinality are all read off it.
+    """
+    n_rows = len(df)
+    na_counts = df.isna().to_numpy().sum(axis=0)
+
+    numeric_columns = list(df.select_dtypes(include=[np.number]).columns)
+    block = df[numeric_columns].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(block)
+    valid_counts = valid.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        filled = np.where(valid, block, 0.0)
+        mean = filled.sum(axis=0) / valid_counts
+        squared_deviation = np.where(valid, (block - mean) ** 2, 0.0)
+        std = np.where(valid_counts > 1, np.sqrt(squared_deviation.sum(axis=0) / (valid_counts - 1)), np.nan)
+
+        # np.sort puts NaNs last, so the first valid_counts rows of each column are its values
+        sorted_block = np.sort(block, axis=0) if n_rows else np.full((1, len(numeric_columns)), np.nan)
+        median = _sorted_quantile(sorted_block, valid_counts, 0.5)
+        q1 = _sorted_quantile(sorted_block, valid_counts, 0.25)
+        q3 = _sorted_quantile(sorted_block, valid_counts, 0.75)
+        minimum = np.where(valid_counts > 0, sorted_block[0], np.nan)
+        maximum = _sorted_quantile(sorted_block, valid_counts, 1.0)
+
+        # Distinct values = 1 + number of value changes down the sorted valid rows
+        changes = (np.diff(sorted_block, axis=0) != 0) & (np.arange(1, len(sorted_block))[:, None] < valid_counts)
+        cardinality = np.where(valid_counts > 0, changes.sum(axis=0) + 1, 0)
+
+        iqr = q3 - q1
+        outliers = (valid & ((block < q1 - 1.5 * iqr) | (block > q3 + 1.5 * iqr))).sum(axis=0)
+
+    profile = {
+        'rows': n_rows,
+        'columns': list(df.columns),
+        'na_fraction': (na_counts / n_rows if n_rows else np.zeros(len(df.columns))).tolist(),
+        'numeric_columns': numeric_columns,
+        'mean': mean.tolist(),
+        'median': median.tolist(),
+        'std': std.tolist(),
+        'min': minimum.tolist(),
+        'max': maximum.tolist(),
+        'q1': q1.tolist(),
+        'q3': q3.tolist(),
+        'cardinality': cardinality.tolist(),
+        'outliers': outliers.tolist()
+    }
+    # Cardinality of the non-numeric columns (e.g. corporation ids)
+    profile['other_cardinality'] = {
+        column: int(df[column].nunique()) for column in df.columns if column not in numeric_columns
+    }
+    return profile
+
+
+# Function to load the dataset once and profile it
+def dataset_profile(output_folder_path=dataset_csv_path):
+    dataframe_path = os.path.join(output_folder_path, "finaldata.csv")
+    fingerprint = dataset.dataset_fingerprint(dataframe_path, dataset_format)
+    cached = _profile_cache.get(dataframe_path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    logging.info("Reading data for profiling...")
+    df = dataset.read_dataset(dataframe_path, data_format=dataset_format)
+    logging.info("Profiling data...")
+    profile = profile_dataframe(df)
+    _profile_cache[dataframe_path] = (fingerprint, profile)
+    # The same load refreshes the summary statistics cache when it was built for other data
+    if summarystats.load_accumulators(dataframe_path, dataset_format) is None:
+        summarystats.save_summary(dataframe_path, summarystats.accumulate(df), dataset_format)
+    return profile
+
+
 # Function to get summary statistics
 def dataframe_summary(output_folder_path=dataset_csv_path):
-    logging.info("Reading data for summary statistics...")
-    # Read the data
-    df = pd.read_csv(os.path.join(output_folder_path, "finaldata.csv"))
-    
-    # Select numeric columns only
-    numeric_columns = df.select_dtypes(include=[np.number]).columns
-    
+    dataframe_path = os.path.join(output_folder_path, "finaldata.csv")
+
+    # Answer from the statistics precomputed at ingestion while the dataset is unchanged
+    statistics = summarystats.cached_summary(dataframe_path, dataset_format)
+    if statistics is not None:
+        return statistics
+
     logging.info("Calculating summary statistics...")
-    # Calculate statistics for each numeric column
-    statistics = []
-    for column in numeric_columns:
-        column_stats = [
-            df[column].mean(),
-            df[column].median(),
-            df[column].std()
-        ]
-        statistics.extend(column_stats)
-    
-    return statistics
+    # Otherwise profile the dataset: one load serves the missing-data check and rebuilds the
+    # cache, so other workers and later calls hit it until the dataset changes
+    dataset_profile(output_folder_path)
+    statistics = summarystats.cached_summary(dataframe_path, dataset_format)
+    if statistics is not None:
+        return statistics
+    # The profile was already in memory but the cache file is gone
+    return summarystats.summary_list(summarystats.rebuild_summary(dataframe_path, dataset_format))
 
 
 # Function to check missing data
 def check_missing_data(output_folder_path=dataset_csv_path):
-    logging.info("Reading data to check for missing values...")
-    # Read the data
-    df = pd.read_csv(os.path.join(output_folder_path, "finaldata.csv"))
-    
     logging.info("Calculating missing data percentages...")
-    # Calculate percent of NA values for each column
-    na_percentages = []
-    for column in df.columns:
-        na_percent = (df[column].isna().sum() / len(df)) * 100
-        na_percentages.append(na_percent)
-    
-    return na_percentages
+    # Percent of NA values for each column, from the profile
+    profile = dataset_profile(output_folder_path)
+    return [fraction * 100 for fraction in profile['na_fraction']]
+
+
+# Function to compare the profile against the per-column pandas loops it replaced
+def benchmark_profile(rows=1000000, seed=0):
+    import tempfile
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'corporation': rng.integers(0, 26 ** 4, rows).astype(str),
+        'lastmonth_activity': rng.integers(0, 1000, rows).astype(float),
+        'lastyear_activity': rng.integers(0, 10000, rows),
+        'number_of_employees': rng.integers(0, 500, rows),
+        'exited': rng.integers(0, 2, rows)
+    })
+    df.loc[rng.random(rows) < 0.01, 'lastmonth_activity'] = np.nan
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'finaldata.csv')
+        df.to_csv(path, index=False)
+
+        # Previous code path: each check re-reads the CSV and loops over columns
+        starttime = time.perf_counter()
+        data = pd.read_csv(path)
+        legacy_summary = []
+        for column in data.select_dtypes(include=[np.number]).columns:
+            legacy_summary.extend([data[column].mean(), data[column].median(), data[column].std()])
+        data = pd.read_csv(path)
+        legacy_missing = [(data[column].isna().sum() / len(data)) * 100 for column in data.columns]
+        legacy_timing = time.perf_counter() - starttime
+
+        # Profile: one read, one vectorized pass
+        starttime = time.perf_counter()
+        profile = profile_dataframe(pd.read_csv(path))
+        profile_timing = time.perf_counter() - starttime
+
+    summary = [value for triple in zip(profile['mean'], profile['median'], profile['std']) for value in triple]
+    missing = [fraction * 100 for fraction in profile['na_fraction']]
+    return {
+        'rows': rows,
+        'legacy_seconds': legacy_timing,
+        'profile_seconds': profile_timing,
+        'speedup': legacy_timing / profile_timing,
+        'results_match': bool(np.allclose(summary, legacy_summary) and np.allclose(missing, legacy_missing))
+    }
 
 
 # Function to get timings
-def execution_time():
-    logging.info("Measuring execution time for ingestion script...")
-    # Timing for ingestion script
-    starttime = timeit.default_timer()
-    os.system('python ingestion.py')
-    ingestion_timing = timeit.default_timer() - starttime
-
-    logging.info("Measuring execution time for training script...")
-    # Timing for training script
-    starttime = timeit.default_timer()
-    os.system('python training.py')
-    training_timing = timeit.default_timer() - starttime
-    
-    return [ingestion_timing, training_timing]
+def execution_time(repetitions=config.get('benchmark_repetitions', 3), warmup=1):
+    """Min/median/p95 wall and CPU time plus peak memory for ingestion and training.
+
+    Stages run in-process against a scratch copy of the data, so the real
+    finaldata.csv and model are left alone; each run is added to the benchmark history.
+    """
+    import benchmark
+    logging.info("Measuring execution time for ingestion and training...")
+    result = benchmark.benchmark_pipeline(config, repetitions=repetitions, warmup=warmup)
+    return {
+        'stages': result['stages'],
+        'regressions': result['regressions']
+    }
+
+# Cached dependency audit, refreshed after dependency_cache_ttl seconds
+_dependency_cache = {'checked_at': None, 'key': None, 'result': None}
+
+
+def _normalize_name(name):
+    # PEP 503 normalization so "scikit_learn" and "scikit-learn" match
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _version_key(version):
+    try:
+        from packaging.version import Version
+        return Version(version)
+    except Exception:
+        # Without packaging, compare the leading numeric release segments
+        return tuple(int(part) for part in re.findall(r'\d+', version.split('+')[0])[:4])
+
+
+def _is_newer(candidate, current):
+    try:
+        return _version_key(candidate) > _version_key(current)
+    except TypeError:
+        return candidate != current
+
 
 ##################Function to check dependencies
-def outdated_packages_list():
+def outdated_packages_list(requirements_path="requirements.txt",
+                           index_snapshot_path=config.get('package_index_snapshot', 'package_index.json'),
+                           ttl=config.get('dependency_cache_ttl', 3600)):
+    """Audit requirements.txt pins against installed distributions, fully offline.
+
+    Installed versions come from importlib.metadata. Latest versions come from an
+    optional local snapshot, a JSON object mapping package name to latest version
+    (refresh it on a connected host); without one only pin drift is reported.
+    Each row is [name, pinned version, installed version, latest version] for
+    packages that are not installed at their pin or have a newer release.
+    """
+    key = (requirements_path, index_snapshot_path)
+    now = time.time()
+    if (_dependency_cache['key'] == key and _dependency_cache['checked_at'] is not None
+            and now - _dependency_cache['checked_at'] < ttl):
+        return _dependency_cache['result']
+
     logging.info("Checking for outdated packages...")
-    # Get installed packages from requirements.txt
-    with open("requirements.txt", 'r') as f:
-        installed = dict(line.strip().split('==') for line in f if '==' in line)
-    
-    # Run pip list --outdated
-    result = subprocess.check_output(['pip', 'list', '--outdated', '--format=json'], text=True)
-    outdated = json.loads(result)
-    
+    # Get pinned packages from requirements.txt
+    with open(requirements_path, 'r') as f:
+        pinned = dict(line.strip().split('==', 1) for line in f if '==' in line and not line.startswith('#'))
+
+    # Latest versions from the local index snapshot, if there is one
+    latest = {}
+    if index_snapshot_path and os.path.exists(index_snapshot_path):
+        with open(index_snapshot_path, 'r') as f:
+            latest = {_normalize_name(name): version for name, version in json.load(f).items()}
+
     # Create output table
     dependencies = []
-    for pkg in outdated:
-        if pkg['name'] in installed:
-            dependencies.append([
-                pkg['name'],
-                installed[pkg['name']],  # installed version
-                pkg['latest_version']    # latest version
-            ])
-    
+    for name, pinned_version in pinned.items():
+        try:
+            installed_version = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            installed_version = None
+        latest_version = latest.get(_normalize_name(name))
+
+        current = installed_version or pinned_version
+        if installed_version != pinned_version or (latest_version and _is_newer(latest_version, current)):
+            dependencies.append([name, pinned_version, installed_version, latest_version])
+
+    _dependency_cache.update(checked_at=now, key=key, result=dependencies)
     return dependencies
 
 
@@ -127,6 +311,13 @@ if __name__ == '__main__':
         elif function_name == 'statistics':
             logging.info("Running dataframe summary...")
             print(dataframe_summary())
+        elif function_name == 'profile':
+            logging.info("Profiling data...")
+            print(json.dumps(dataset_profile(), indent=4))
+        elif function_name == 'benchmark':
+            logging.info("Benchmarking data profile...")
+            rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+            print(benchmark_profile(rows))
         elif function_name == 'missing':
             logging.info("Checking missing data...")
             print(check_missing_data())
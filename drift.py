@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import logging
+import settings
+import numpy as np
+import pandas as pd
+import dataset
+from inference import FEATURE_COLUMNS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Reference histograms of the training data, written next to the deployed model
+REFERENCE_FILE = 'driftreference.json'
+
+# Last report of the pipeline's drift gate, written next to the trained model and served at GET /drift
+REPORT_FILE = 'driftreport.json'
+
+# Floor for bin proportions so PSI stays finite when a bin is empty on one side
+PSI_EPSILON = 1e-4
+
+# In-process copy of the last drift report, keyed by reference and dataset identity
+_memo = {'key': None, 'report': None}
+
+
+def _bin_counts(values, edges):
+    # Bins are (-inf, e1], (e1, e2], ..., (ek, inf) over the inner edges
+    counts = np.bincount(np.searchsorted(edges, values, side='left'), minlength=len(edges) + 1)
+    return counts.astype(np.float64)
+
+
+def _finite(value):
+    # NaN and inf are not valid JSON; an undefined score is reported as null
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+# Function to build the reference histograms from the training data
+def build_reference(df, columns=FEATURE_COLUMNS, bins=10):
+    """Quantile bin edges, bin counts and moments for each feature column"""
+    reference = {'bins': bins, 'rows': int(len(df)), 'columns': {}}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        # Quantile edges collapse on discrete columns; duplicates are dropped
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])) if len(values) else np.array([])
+        reference['columns'][column] = {
+            'edges': edges.tolist(),
+            'counts': _bin_counts(values, edges).tolist(),
+            'count': int(len(values)),
+            'mean': float(values.mean()) if len(values) else float('nan'),
+            'var': float(values.var(ddof=1)) if len(values) > 1 else float('nan')
+        }
+    return reference
+
+
+def save_reference(dataframe_path, reference_path, bins=10, data_format='csv'):
+    df = dataset.read_dataset(dataframe_path, columns=FEATURE_COLUMNS, data_format=data_format)
+    reference = build_reference(df, bins=bins)
+    temporary = reference_path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(reference, f, indent=4)
+    os.replace(temporary, reference_path)
+    logging.info(f"Saved drift reference for {len(df)} rows to {reference_path}")
+    return reference
+
+
+def load_reference(reference_path):
+    with open(reference_path, 'r') as f:
+        return json.load(f)
+
+
+# Function to compare new data against the reference
+def compute_drift(reference, df, psi_threshold=0.2, ks_threshold=0.2):
+    """Per-feature PSI, KS statistic and mean/variance shift of df against the reference.
+
+    KS is taken over the reference bin edges, so it is a lower bound of the
+    exact two-sample statistic. The mean shift is in reference standard
+    deviations; the variance ratio is new / reference. Either is None when
+    undefined (e.g. a constant reference column, or too few new values).
+    """
+    report = {'rows': int(len(df)), 'drift': False, 'drifted_columns': [], 'columns': {}}
+    for column, ref in reference['columns'].items():
+        values = df[column].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        edges = np.asarray(ref['edges'], dtype=np.float64)
+
+        expected = np.asarray(ref['counts']) / max(ref['count'], 1)
+        actual = _bin_counts(values, edges) / max(len(values), 1)
+        psi = float(np.sum((actual - expected) * np.log(np.maximum(actual, PSI_EPSILON) / np.maximum(expected, PSI_EPSILON))))
+        ks = float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+
+        mean = float(values.mean()) if len(values) else float('nan')
+        var = float(values.var(ddof=1)) if len(values) > 1 else float('nan')
+        ref_var = ref['var'] if ref['var'] is not None and ref['var'] > 0 else float('nan')
+        drifted = psi > psi_threshold or ks > ks_threshold
+
+        report['columns'][column] = {
+            'psi': psi,
+            'ks': ks,
+            'mean_shift': _finite((mean - ref['mean']) / np.sqrt(ref_var)) if ref['mean'] is not None else None,
+            'variance_ratio': _finite(var / ref_var),
+            'drift': drifted
+        }
+        if drifted:
+            report['drifted_columns'].append(column)
+    report['drift'] = bool(report['drifted_columns'])
+    return report
+
+
+def detect_drift(reference_path, dataframe_path, data_format='csv', psi_threshold=0.2, ks_threshold=0.2):
+    """Drift report of the ingested dataset against the deployed reference (memoized while both are unchanged)"""
+    stat = os.stat(reference_path)
+    key = (reference_path, stat.st_size, stat.st_mtime_ns,
+           dataset.dataset_fingerprint(dataframe_path, data_format), psi_threshold, ks_threshold)
+    if _memo['key'] == key:
+        return _memo['report']
+
+    reference = load_reference(reference_path)
+    df = dataset.read_dataset(dataframe_path, columns=list(reference['columns']), data_format=data_format)
+    report = compute_drift(reference, df, psi_threshold, ks_threshold)
+    _memo['key'], _memo['report'] = key, report
+    return report
+
+
+def detect_drift_in_files(reference_path, file_paths, psi_threshold=0.2, ks_threshold=0.2):
+    """Drift report of only the given source files (the newly arrived batch) against the deployed reference"""
+    reference = load_reference(reference_path)
+    columns = list(reference['columns'])
+    df = pd.concat([dataset.read_dataset(path, columns=columns) for path in file_paths], ignore_index=True)
+    return compute_drift(reference, df, psi_threshold, ks_threshold)
+
+
+def save_report(report, report_path, sources):
+    """Persist a drift report with the files it compared, so other processes see what the gate decided"""
+    saved = {'checked_at': time.time(), 'sources': list(sources), **report}
+    temporary = report_path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(saved, f, indent=4)
+    os.replace(temporary, report_path)
+    return saved
+
+
+def load_report(report_path):
+    with open(report_path, 'r') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    config = settings.get_config()
+
+    if len(sys.argv) > 1:
+        # Check the given source files, as the pipeline's drift gate does with a new batch
+        report = detect_drift_in_files(
+            os.path.join(config['prod_deployment_path'], REFERENCE_FILE), sys.argv[1:],
+            psi_threshold=config.get('drift_psi_threshold', 0.2),
+            ks_threshold=config.get('drift_ks_threshold', 0.2)
+        )
+    else:
+        report_path = os.path.join(config['output_model_path'], REPORT_FILE)
+        if not os.path.exists(report_path):
+            sys.exit("No drift check has run yet; pass source files to check them")
+        report = load_report(report_path)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+import dataset
+import inference
+import settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Number of recent evaluations kept in memory per process
+MEMO_SIZE = 16
+
+# One model evaluated on one dataset; metrics is None when the data has no 'exited' labels.
+# The arrays are read-only because the same objects are handed to every caller.
+Evaluation = namedtuple('Evaluation', ['key', 'predictions', 'probabilities', 'metrics'])
+
+_memo = OrderedDict()
+_lock = threading.Lock()
+
+
+def model_hash(arrays):
+    """Content hash of a linear model: coefficients, intercept, classes and feature order"""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(arrays.coef, dtype=np.float64).tobytes())
+    digest.update(np.float64(arrays.intercept).tobytes())
+    digest.update(json.dumps([np.asarray(arrays.classes).tolist(), list(arrays.feature_columns)]).encode())
+    return digest.hexdigest()
+
+
+def evaluation_key(arrays, data_path, data_format='csv'):
+    """(model hash, dataset fingerprint) as a file-name-safe string"""
+    fingerprint = dataset.dataset_fingerprint(data_path, data_format)
+    if fingerprint is None:
+        raise FileNotFoundError(f"Dataset not found: {data_path}")
+    # The stat-based fingerprint only names the file, so the full path is folded in as well
+    data_hash = hashlib.sha256(f"{os.path.realpath(data_path)}|{fingerprint}".encode()).hexdigest()
+    return f"{model_hash(arrays)[:16]}_{data_hash[:16]}"
+
+
+def _average_ranks(values):
+    # 1-based ranks with ties sharing their average rank
+    unique, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    starts = np.cumsum(counts) - counts
+    return (starts + (counts + 1) / 2.0)[inverse]
+
+
+def classification_metrics(y_true, probabilities, predictions):
+    """Confusion matrix, precision/recall/F1/accuracy, ROC AUC and threshold curves for a binary problem"""
+    y_true = np.asarray(y_true).astype(np.intp)
+    predictions = np.asarray(predictions).astype(np.intp)
+    tp = int(np.sum((predictions == 1) & (y_true == 1)))
+    fp = int(np.sum((predictions == 1) & (y_true == 0)))
+    fn = int(np.sum((predictions == 0) & (y_true == 1)))
+    tn = int(np.sum((predictions == 0) & (y_true == 0)))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    positives = int(y_true.sum())
+    negatives = len(y_true) - positives
+    if positives and negatives:
+        # Mann-Whitney form of the ROC AUC
+        ranks = _average_ranks(probabilities)
+        auc = float((ranks[y_true == 1].sum() - positives * (positives + 1) / 2.0) / (positives * negatives))
+    else:
+        auc = None
+
+    if not len(y_true):
+        # Nothing to rank: zero counts and empty curves, as sklearn returns zeros for undefined metrics
+        return {'rows': 0, 'confusion_matrix': [[0, 0], [0, 0]], 'accuracy': 0.0, 'precision': 0.0,
+                'recall': 0.0, 'f1': 0.0, 'roc_auc': None,
+                'curves': {'thresholds': [], 'tpr': [], 'fpr': [], 'precision': []}}
+
+    # One point per distinct score, highest threshold first
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    order = np.argsort(-probabilities, kind='stable')
+    sorted_scores = probabilities[order]
+    sorted_true = y_true[order]
+    last_of_run = np.r_[np.nonzero(np.diff(sorted_scores))[0], len(sorted_scores) - 1]
+    true_positives = np.cumsum(sorted_true)[last_of_run]
+    false_positives = (last_of_run + 1) - true_positives
+
+    return {
+        'rows': int(len(y_true)),
+        # [[tn, fp], [fn, tp]], same layout as sklearn.metrics.confusion_matrix
+        'confusion_matrix': [[tn, fp], [fn, tp]],
+        'accuracy': (tp + tn) / len(y_true),
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'roc_auc': auc,
+        'curves': {
+            'thresholds': sorted_scores[last_of_run].tolist(),
+            'tpr': (true_positives / positives if positives else np.zeros(len(last_of_run))).tolist(),
+            'fpr': (false_positives / negatives if negatives else np.zeros(len(last_of_run))).tolist(),
+            'precision': (true_positives / (last_of_run + 1)).tolist()
+        }
+    }
+
+
+def _compute(arrays, data_path, data_format):
+    columns = list(arrays.feature_columns)
+    labelled = 'exited' in dataset.dataset_columns(data_path, data_format)
+    data = dataset.read_dataset(data_path, columns=columns + (['exited'] if labelled else []), data_format=data_format)
+    if data.empty:
+        raise ValueError(f"Dataset is empty: {data_path}")
+
+    # One pass over the data gives both the probabilities and the labels
+    X = inference.feature_matrix(data, columns)
+    probabilities = inference.predict_proba(arrays, X)
+    predictions = inference.predict(arrays, X)
+    metrics = classification_metrics(data['exited'].to_numpy(), probabilities, predictions) if labelled else None
+    return predictions, probabilities, metrics
+
+
+def _read_cached(path):
+    with np.load(path, allow_pickle=False) as data:
+        return data['predictions'].copy(), data['probabilities'].copy(), json.loads(str(data['metrics']))
+
+
+def _write_cached(path, predictions, probabilities, metrics, max_entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        np.savez(f, predictions=predictions, probabilities=probabilities, metrics=np.array(json.dumps(metrics)))
+    os.replace(temporary, path)
+
+    # Keep only the newest entries; old models and datasets are rarely evaluated again
+    cache_dir = os.path.dirname(path)
+    entries = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.npz')),
+                     key=os.path.getmtime, reverse=True)
+    for stale in entries[max_entries:]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+# Function to evaluate a model on a dataset, once per (model, dataset)
+def evaluate(arrays, data_path, data_format='csv', cache_dir=None):
+    """Predictions, positive-class probabilities and (for labelled data) metrics of arrays on data_path.
+
+    Results are kept in memory and as .npz files in cache_dir (config.json:
+    evaluation_cache_path), so the pipeline stages, the diagnostics and the
+    API processes all share one pass per model and dataset.
+    """
+    config = settings.get_config()
+    if cache_dir is None:
+        cache_dir = config.get('evaluation_cache_path', 'evaluationcache')
+
+    key = evaluation_key(arrays, data_path, data_format)
+    with _lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    cache_file = os.path.join(cache_dir, key + '.npz')
+    result = None
+    if os.path.exists(cache_file):
+        try:
+            result = _read_cached(cache_file)
+            logging.info(f"Evaluation of {os.path.basename(data_path)} loaded from cache ({key})")
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable evaluation cache entry {cache_file}: {str(e)}")
+
+    if result is None:
+        logging.info(f"Evaluating model on {data_path}...")
+        result = _compute(arrays, data_path, data_format)
+        try:
+            _write_cached(cache_file, *result, max_entries=int(config.get('evaluation_cache_entries', 50)))
+        except OSError as e:
+            logging.warning(f"Could not write evaluation cache entry {cache_file}: {str(e)}")
+
+    predictions, probabilities, metrics = result
+    predictions.setflags(write=False)
+    probabilities.setflags(write=False)
+    evaluation = Evaluation(key, predictions, probabilities, metrics)
+    with _lock:
+        _memo[key] = evaluation
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return evaluation
+
+
+def evaluate_model(model, data_path, data_format='csv', cache_dir=None):
+    """evaluate() for a fitted binary linear model (e.g. an unpickled LogisticRegression)"""
+    return evaluate(inference.model_to_arrays(model), data_path, data_format, cache_dir)
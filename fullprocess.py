@@ -1,13 +1,13 @@
 import json
 import os
-import training
-import scoring
-import deployment
-import diagnostics
-import reporting
-import ingestion
-import apicalls
+import sys
+import time
 import logging
+import settings
+import manifests
+
+# Stage modules (and with them pandas, scikit-learn, requests) are imported only once
+# there is work to do, so the common "no new files" cron run starts and exits quickly
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,8 +15,7 @@ logging.basicConfig(
 )
 
 # Load config.json file
-with open('config.json','r') as f:
-    config = json.load(f)
+config = settings.get_config()
 
 input_folder_path = config['input_folder_path']
 prod_deployment_path = config['prod_deployment_path']
@@ -29,17 +28,25 @@ dataframe_output_path = os.path.join(output_folder_path, 'finaldata.csv')
 ingested_file_path = os.path.join(output_folder_path, 'ingestedfiles.txt')
 
 def read_ingested_files():
-    """Read and return the list of files from ingestedfiles.txt"""
+    """Read and return the manifest entries from ingestedfiles.txt, keyed by file name"""
     ingested_files_path = os.path.join(prod_deployment_path, "ingestedfiles.txt")
-    with open(ingested_files_path, 'r') as f:
-        ingested_files = [line.strip() for line in f.readlines()]
-    return ingested_files
+    return manifests.read_manifest(ingested_files_path)
 
 def check_for_new_files():
-    """Check for files in input folder that haven't been ingested"""
+    """Check for files in input folder that haven't been ingested or have changed since"""
     ingested_files = read_ingested_files()
     current_files = [f for f in os.listdir(input_folder_path) if f.endswith('.csv')]
-    return [f for f in current_files if f not in ingested_files]
+    new_files = []
+    for f in current_files:
+        entry = ingested_files.get(f)
+        if entry is None:
+            new_files.append(f)
+        elif entry['size'] is not None:
+            # Size/mtime are only known for manifests written with file stats
+            stat = os.stat(os.path.join(input_folder_path, f))
+            if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+                new_files.append(f)
+    return new_files
 
 def read_latest_score():
     """Read the score from latestscore.txt"""
@@ -47,72 +54,253 @@ def read_latest_score():
     with open(latest_score_path, 'r') as f:
         return float(f.read().strip())
 
-def check_model_drift():
-    """Check if model drift occurred by comparing scores"""
+def score_drift():
+    """Fallback when no drift reference was deployed: F1 of the deployed model on the ingested data vs latestscore.txt"""
+    import pickle
+    import evaluation
+    model_file_path = os.path.join(prod_deployment_path, output_model_file)
+    if not os.path.exists(model_file_path):
+        logging.error(f"Model file not found at {model_file_path}")
+        return False
+
+    old_score = read_latest_score()
+    logging.info(f"Retrieved old score: {old_score}")
+
+    with open(model_file_path, 'rb') as f:
+        model = pickle.load(f)
+    result = evaluation.evaluate_model(model, dataframe_output_path, data_format=config.get('dataset_format', 'csv'))
+    new_score = result.metrics['f1']
+    logging.info(f"Calculated new score: {new_score}")
+    return new_score < old_score
+
+def check_model_drift(new_files=()):
+    """Check if the newly ingested data drifted from the data the deployed model was trained on.
+
+    Only the new source files are compared: the consolidated dataset also holds
+    the rows the reference was built from, which would dilute any shift.
+    """
+    import drift
     try:
-        # Verify test data exists
-        if not os.path.exists(test_data_path):
-            logging.error(f"Test data not found at {test_data_path}")
-            return False
-            
-        # Verify model exists
-        if not os.path.exists(os.path.join(prod_deployment_path, output_model_file)):
-            logging.error(f"Model file not found at {os.path.join(output_model_path, output_model_file)}")
-            return False
-            
-        old_score = read_latest_score()
-        logging.info(f"Retrieved old score: {old_score}")
-        
-        new_score = scoring.score_model(prod_deployment_path, output_folder_path)
-        logging.info(f"Calculated new score: {new_score}")
-        
-        if new_score is None or old_score is None:
-            logging.warning("Could not compare scores - one or both scores are None")
-            return False
-        
-        return new_score < old_score
-        
+        reference_path = os.path.join(prod_deployment_path, drift.REFERENCE_FILE)
+        if not os.path.exists(reference_path):
+            logging.warning("No drift reference deployed, comparing F1 scores instead")
+            return score_drift()
+
+        psi_threshold = config.get('drift_psi_threshold', 0.2)
+        ks_threshold = config.get('drift_ks_threshold', 0.2)
+        if new_files:
+            sources = [os.path.join(input_folder_path, f) for f in new_files]
+            report = drift.detect_drift_in_files(
+                reference_path, sources,
+                psi_threshold=psi_threshold, ks_threshold=ks_threshold
+            )
+        else:
+            logging.warning("No new source files given, comparing the whole ingested dataset")
+            sources = [dataframe_output_path]
+            report = drift.detect_drift(
+                reference_path, dataframe_output_path,
+                data_format=config.get('dataset_format', 'csv'),
+                psi_threshold=psi_threshold, ks_threshold=ks_threshold
+            )
+        # The API serves this report, so /drift agrees with the gate
+        os.makedirs(output_model_path, exist_ok=True)
+        drift.save_report(report, os.path.join(output_model_path, drift.REPORT_FILE), sources)
+        for column, scores in report['columns'].items():
+            # mean shift and variance ratio are None when undefined (e.g. a constant column)
+            logging.info(f"Drift {column}: PSI {scores['psi']:.4f}, KS {scores['ks']:.4f}, "
+                         f"mean shift {scores['mean_shift']} sd, variance ratio {scores['variance_ratio']}")
+        return report['drift']
+
     except Exception as e:
         logging.error(f"Error in checking model drift: {str(e)}")
         return False
 
+def build_stages(new_files=()):
+    """The full process as a DAG; each stage declares the files it reads and writes.
+
+    ``new_files`` are the source files that triggered the run; the drift gate checks them.
+    """
+    import pipeline
+    import dataset
+    import ingestion
+    import summarystats
+    import training
+    import tuning
+    import scoring
+    import deployment
+    import reporting
+    import apicalls
+    import inference
+    import drift
+
+    model_file_path = os.path.join(output_model_path, output_model_file)
+    score_file_path = os.path.join(output_model_path, 'latestscore.txt')
+    training_state_files = [training.TRAINED_ROWS_FILE, training.TRAINING_STATE_FILE]
+    ingestion_mode = config.get('ingestion_mode', 'full')
+    data_format = config.get('dataset_format', 'csv')
+    # The file the trainer really reads: the Parquet dataset when that is the format, else finaldata.csv
+    training_data_paths = [dataframe_output_path] + ([dataset.parquet_path(dataframe_output_path)]
+                                                     if data_format == 'parquet' else [])
+
+    def run_ingestion():
+        ingestion.ingest_data(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                              mode=ingestion_mode,
+                              data_format=data_format,
+                              csv_export=config.get('csv_export', True),
+                              chunk_size=config.get('chunk_size', 100000),
+                              seen_set_limit=config.get('seen_set_limit', 2000000),
+                              workers=config.get('ingestion_workers', 1),
+                              csv_engine=config.get('csv_engine', 'c'))
+
+    def run_drift_check():
+        if check_model_drift(new_files):
+            print("Model drift detected. Proceeding with model retraining and deployment")
+            return True
+        print("No model drift detected. Maintaining current model.")
+        return False
+
+    def run_training():
+        print("Re-training model with new data...")
+        if training.train_model(dataframe_output_path, model_file_path, output_data_file, output_model_file) is None:
+            raise RuntimeError("Model training failed")
+
+    def run_scoring():
+        if scoring.score_model(output_model_path, test_data_path) is None:
+            raise RuntimeError("Scoring of the re-trained model failed")
+
+    def run_deployment():
+        print("Re-deploying model...")
+        if deployment.store_model_into_pickle(output_folder_path, output_model_path, prod_deployment_path,
+                                                data_format=data_format) is None:
+            raise RuntimeError("Model deployment failed")
+
+    def run_reporting():
+        print("Generating reports and diagnostics...")
+        reporting.score_model(output_model_path, prod_deployment_path, test_data_path)
+
+    # Incremental ingestion depends on the previous dataset, and Parquet output is a
+    # directory, so only full/streaming CSV ingestion is served from the cache
+    ingestion_cacheable = ingestion_mode != 'incremental' and data_format == 'csv'
+    return [
+        pipeline.Stage('ingestion', run_ingestion,
+                       inputs=[input_folder_path],
+                       # Row index and summary cache describe the dataset, so they are restored with it
+                       outputs=[dataframe_output_path, ingested_file_path,
+                                os.path.join(output_folder_path, ingestion.ROW_INDEX_FILE),
+                                summarystats.summary_path(dataframe_output_path)],
+                       params={key: config.get(key) for key in ('ingestion_mode', 'dataset_format', 'csv_export')},
+                       cacheable=ingestion_cacheable),
+        pipeline.Stage('drift', run_drift_check, after=['ingestion'], cacheable=False),
+        # Incremental training also reads the deployed model and what it was trained on
+        pipeline.Stage('training', run_training,
+                       inputs=training_data_paths + [os.path.join(prod_deployment_path, output_model_file)]
+                              + [os.path.join(prod_deployment_path, name) for name in training_state_files]
+                              + [os.path.join(output_model_path, tuning.BEST_CONFIG_FILE)],
+                       # Row bookkeeping is only written by incremental training
+                       outputs=[model_file_path] + ([os.path.join(output_model_path, name) for name in training_state_files]
+                                                    if config.get('training_mode', 'full') == 'incremental' else []),
+                       params={key: config.get(key) for key in ('training_mode', 'full_refit_every', 'incremental_epochs',
+                                                                'incremental_alpha', 'incremental_learning_rate',
+                                                                'use_tuned_params', 'dataset_format', 'csv_export')},
+                       after=['drift']),
+        pipeline.Stage('scoring', run_scoring,
+                       inputs=[model_file_path, test_data_path],
+                       outputs=[score_file_path],
+                       after=['training']),
+        pipeline.Stage('deployment', run_deployment,
+                       inputs=[model_file_path, score_file_path, dataframe_output_path, ingested_file_path]
+                              + [os.path.join(output_model_path, name) for name in training_state_files],
+                       outputs=[os.path.join(prod_deployment_path, output_model_file),
+                                os.path.join(prod_deployment_path, 'latestscore.txt'),
+                                os.path.join(prod_deployment_path, 'ingestedfiles.txt'),
+                                os.path.join(prod_deployment_path, inference.ARRAYS_FILE),
+                                os.path.join(prod_deployment_path, drift.REFERENCE_FILE)]
+                               + [os.path.join(prod_deployment_path, name) for name in training_state_files],
+                       after=['scoring'],
+                       # Publishing to the model store and flipping its pointer must really happen
+                       cacheable=False),
+        pipeline.Stage('reporting', run_reporting,
+                       inputs=[os.path.join(prod_deployment_path, output_model_file),
+                               os.path.join(prod_deployment_path, inference.ARRAYS_FILE), test_data_path],
+                       outputs=[os.path.join(output_model_path, reporting.METRICS_FILE)],
+                       after=['deployment']),
+        # API responses depend on the running service, so they are never cached
+        pipeline.Stage('apicalls', apicalls.main, after=['deployment'], cacheable=False)
+    ]
+
 def main():
     """Main function to run the full process."""
     # Check and read new data
     new_files = check_for_new_files()
 
     # Deciding whether to proceed, part 1
-    if len(new_files) > 0:
-        print("New files found. Running ingestion process")
-        ingestion.merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path)
-        
-        # Checking for model drift
-        if check_model_drift():
-            print("Model drift detected. Proceeding with model retraining and deployment")
-            
-            # Re-training
-            print("Re-training model with new data...")
-            training.train_model(output_folder_path, output_model_path, output_data_file, output_model_file)
-            
-            # Re-deployment
-            print("Re-deploying model...")
-            deployment.store_model_into_pickle(output_folder_path, output_model_path, prod_deployment_path)
-            
-            # Diagnostics and reporting
-            print("Generating reports and diagnostics...")
-            reporting.score_model(output_model_path, prod_deployment_path, test_data_path)
-            apicalls.main()
-            
-            print("Full process completed successfully!")
-        else:
-            print("No model drift detected. Maintaining current model.")
-            return
-    else:
+    if len(new_files) == 0:
         print("No new files found. Exiting process.")
         return
 
+    print("New files found. Running ingestion process")
+    import pipeline
+    report = pipeline.run_pipeline(
+        build_stages(new_files),
+        config.get('pipeline_cache_path', 'pipelinecache'),
+        max_workers=config.get('pipeline_workers', 2),
+        max_entries=int(config.get('pipeline_cache_entries', 5))
+    )
+    print(pipeline.format_report(report))
+
+    os.makedirs(output_model_path, exist_ok=True)
+    with open(os.path.join(output_model_path, 'pipelinereport.json'), 'w') as f:
+        json.dump(report, f, indent=4)
+
+    if all(record['status'] in pipeline.COMPLETED for record in report):
+        print("Full process completed successfully!")
+    return report
+
+def watch():
+    """Long-running mode: run the full process as soon as a complete batch of source files lands"""
+    import watcher
+
+    # Files main() would not treat as new count as processed, so a restart doesn't replay them
+    processed = {
+        name: (entry['size'], entry['mtime_ns'])
+        for name, entry in read_ingested_files().items()
+        if entry['size'] is not None
+    }
+    source_watcher = watcher.SourceWatcher(
+        input_folder_path,
+        processed=processed,
+        debounce_seconds=config.get('watch_debounce_seconds', 2),
+        settle_seconds=config.get('watch_settle_seconds', 1),
+        poll_interval=config.get('watch_poll_interval', 1),
+        max_wait_seconds=config.get('watch_max_wait_seconds', 60)
+    )
+    try:
+        while True:
+            batch = source_watcher.wait_for_batch()
+            logging.info(f"New batch of {len(batch)} file(s): {', '.join(sorted(batch))}")
+            try:
+                report = main()
+                failed = [record['stage'] for record in report or [] if record['status'] == 'failed']
+            except Exception as e:
+                logging.error(f"Error in full process for batch: {str(e)}")
+                failed = ['fullprocess']
+            if failed:
+                # Left unprocessed so the batch is retried, after a pause rather than in a tight loop
+                retry_seconds = config.get('watch_retry_seconds', 60)
+                logging.error(f"Full process failed ({', '.join(failed)}), retrying batch in {retry_seconds}s")
+                time.sleep(retry_seconds)
+            else:
+                source_watcher.mark_processed(batch)
+    except KeyboardInterrupt:
+        logging.info("Stopping watcher")
+    finally:
+        source_watcher.close()
+
 if __name__ == "__main__":
-    main()
+    if '--watch' in sys.argv[1:]:
+        watch()
+    else:
+        main()
 
 
 
@@ -0,0 +1,93 @@
+import numpy as np
+import logging
+from collections import namedtuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Feature order the model is trained on (finaldata.csv minus 'corporation' and 'exited')
+FEATURE_COLUMNS = ['lastmonth_activity', 'lastyear_activity', 'number_of_employees']
+
+# Name of the array artifact written next to trainedmodel.pkl on deployment
+ARRAYS_FILE = 'trainedmodel.npz'
+
+# Plain arrays describing a binary linear classifier
+LinearModelArrays = namedtuple('LinearModelArrays', ['coef', 'intercept', 'classes', 'feature_columns'])
+
+
+def model_to_arrays(model, feature_columns=FEATURE_COLUMNS):
+    """Extract coefficients, intercept and classes from a fitted binary linear model"""
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.shape != (1, len(feature_columns)):
+        raise ValueError(f"Expected a binary model over {len(feature_columns)} features, got coef_ shape {coef.shape}")
+    return LinearModelArrays(
+        coef=coef.ravel(),
+        intercept=float(np.asarray(model.intercept_, dtype=np.float64).ravel()[0]),
+        classes=np.asarray(model.classes_),
+        feature_columns=list(feature_columns)
+    )
+
+
+def export_model_arrays(model, output_path, feature_columns=FEATURE_COLUMNS):
+    """Write the model's coefficients, intercept, classes and feature order to a .npz file"""
+    arrays = model_to_arrays(model, feature_columns)
+    with open(output_path, 'wb') as f:
+        np.savez(
+            f,
+            coef=arrays.coef,
+            intercept=np.array([arrays.intercept]),
+            classes=arrays.classes,
+            feature_columns=np.array(arrays.feature_columns)
+        )
+    logging.info(f"Exported model arrays to {output_path}")
+    return arrays
+
+
+def load_model_arrays(path):
+    with np.load(path, allow_pickle=False) as data:
+        return LinearModelArrays(
+            coef=data['coef'].astype(np.float64),
+            intercept=float(data['intercept'][0]),
+            classes=data['classes'].copy(),
+            feature_columns=[str(c) for c in data['feature_columns']]
+        )
+
+
+def feature_matrix(df, feature_columns=FEATURE_COLUMNS):
+    """Select the model features from a DataFrame as a float matrix, in training order"""
+    return df[list(feature_columns)].to_numpy(dtype=np.float64)
+
+
+def decision_function(arrays, X):
+    return np.asarray(X, dtype=np.float64) @ arrays.coef + arrays.intercept
+
+
+def predict_proba(arrays, X):
+    """Probability of the positive class: sigmoid of the linear score"""
+    z = decision_function(arrays, X)
+    # tanh form of the logistic function does not overflow for large |z|
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def predict(arrays, X):
+    # Same rule as sklearn's LinearClassifierMixin.predict for binary problems
+    z = decision_function(arrays, X)
+    return arrays.classes[(z > 0).astype(np.intp)]
+
+
+def check_parity(model, arrays, X, atol=1e-9):
+    """Compare the NumPy scorer against model.predict_proba / model.predict on X.
+
+    Raises ValueError when probabilities differ by more than ``atol`` or any label
+    differs; returns the maximum absolute probability difference otherwise.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    positive_index = list(model.classes_).index(arrays.classes[1])
+    expected = model.predict_proba(X)[:, positive_index]
+    actual = predict_proba(arrays, X)
+    max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    if max_diff > atol:
+        raise ValueError(f"NumPy scorer differs from predict_proba by {max_diff} (tolerance {atol})")
+    if not np.array_equal(model.predict(X), predict(arrays, X)):
+        raise ValueError("NumPy scorer labels differ from model.predict")
+    return max_diff
@@ -1,28 +1,93 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 import json
 import logging
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+import dataset
+import summarystats
+import settings
+from manifests import file_sha256, file_entry, read_manifest, write_manifest
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Function for data ingestion
-def merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path):
+# Persistent index of row hashes for everything already in the consolidated dataset
+ROW_INDEX_FILE = 'rowhashes.npy'
+
+
+# Function to hash rows so that equal rows (as drop_duplicates sees them) hash equally
+def row_hashes(df):
+    # Numeric columns are hashed as float64 so that 45 and 45.0 from differently typed files match
+    normalized = df.apply(lambda column: column.astype('float64') if pd.api.types.is_numeric_dtype(column) else column)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+
+
+def save_row_index(index_path, hashes):
+    np.save(index_path, np.unique(hashes))
+
+
+def load_row_index(index_path, dataframe_output_path, data_format='csv'):
+    # Rebuilt from the consolidated dataset if the index is missing (e.g. after a full run by an older version)
+    if os.path.exists(index_path):
+        return np.load(index_path)
+    logging.info(f"Row index not found, rebuilding from {dataframe_output_path}")
+    hashes = np.unique(row_hashes(dataset.read_dataset(dataframe_output_path, data_format=data_format)))
+    np.save(index_path, hashes)
+    return hashes
+
+
+# Function to parse one source file (module level so process pools can pickle it)
+def read_source_file(file_path, csv_engine='c'):
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, engine=csv_engine)
+    return df, time.perf_counter() - start
+
+
+# Function to parse source files, in parallel when workers > 1
+def read_source_files(file_paths, workers=1, csv_engine='c'):
+    """Return the parsed DataFrames in the same order as file_paths.
+
+    The pyarrow engine parses without holding the GIL, so it runs on threads;
+    the default C engine runs on a process pool.
+    """
+    engines = [csv_engine] * len(file_paths)
+    if workers > 1 and len(file_paths) > 1:
+        executor_class = ThreadPoolExecutor if csv_engine == 'pyarrow' else ProcessPoolExecutor
+        with executor_class(max_workers=min(workers, len(file_paths))) as executor:
+            # map() yields results in submission order, whatever order workers finish in
+            results = list(executor.map(read_source_file, file_paths, engines))
+    else:
+        results = [read_source_file(path, engine) for path, engine in zip(file_paths, engines)]
+
     df_list = []
-    
+    for file_path, (df, elapsed) in zip(file_paths, results):
+        logging.info(f"Read file {file_path} ({len(df)} rows in {elapsed:.3f}s)")
+        df_list.append(df)
+    return df_list
+
+
+# Function for data ingestion
+def merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                             data_format='csv', csv_export=True, workers=1, csv_engine='c'):
     # List all files in input folder
     filenames = os.listdir(input_folder_path)
     logging.info(f"Found {len(filenames)} files in {input_folder_path}")
     
-    # Read and combine all CSV files
-    for file in filenames:
-        if file.endswith('.csv'):
-            file_path = os.path.join(input_folder_path, file)
-            df = pd.read_csv(file_path)
-            df_list.append(df)
-            logging.info(f"Read file {file_path}")
+    # Read and combine all CSV files; sorted so the result doesn't depend on directory order
+    filenames = sorted(f for f in filenames if f.endswith('.csv'))
+    start = time.perf_counter()
+    df_list = read_source_files([os.path.join(input_folder_path, f) for f in filenames], workers, csv_engine)
+    logging.info(f"Parsed {len(df_list)} files with {workers} worker(s) in {time.perf_counter() - start:.3f}s")
     
     # Concatenate all dataframes and remove duplicates
     final_df = pd.concat(df_list, axis=0, ignore_index=True)
@@ -30,20 +95,272 @@ def merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_ou
     logging.info("Concatenated dataframes and removed duplicates")
     
     # Save final dataframe
-    final_df.to_csv(dataframe_output_path, index=False)
+    dataset.write_dataset(final_df, dataframe_output_path, data_format=data_format, csv_export=csv_export)
     logging.info(f"Saved final dataframe to {dataframe_output_path}")
     
+    # Precompute the summary statistics served by /summarystats
+    summarystats.save_summary(dataframe_output_path, summarystats.accumulate(final_df), data_format)
+    
+    # Save the row index so later incremental runs can dedupe against it
+    save_row_index(os.path.join(output_folder_path, ROW_INDEX_FILE), row_hashes(final_df))
+    
     # Record ingested files
-    with open(ingested_file_path, 'w') as f:
+    manifest = {file: file_entry(os.path.join(input_folder_path, file)) for file in filenames}
+    write_manifest(ingested_file_path, manifest)
+    logging.info(f"Recorded ingested files to {ingested_file_path}")
+
+
+# Function for incremental data ingestion
+def merge_new_files(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                    data_format='csv', csv_export=True):
+    """Append only rows from new or changed source files to the consolidated dataset.
+
+    Files whose size and mtime match the manifest are skipped without being read;
+    files whose stats moved but whose content hash matches only get their manifest
+    entry refreshed. Rows are deduplicated against the persistent row-hash index,
+    so the result matches a full run as long as source files only ever gain rows.
+    """
+    index_path = os.path.join(output_folder_path, ROW_INDEX_FILE)
+    if not dataset.dataset_exists(dataframe_output_path, data_format):
+        logging.info("No consolidated dataset yet, running full ingestion")
+        merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                                 data_format=data_format, csv_export=csv_export)
+        return
+
+    manifest = read_manifest(ingested_file_path)
+    filenames = sorted(f for f in os.listdir(input_folder_path) if f.endswith('.csv'))
+    logging.info(f"Found {len(filenames)} files in {input_folder_path}")
+
+    # Work out which files need parsing
+    to_read = []
+    for file in filenames:
+        file_path = os.path.join(input_folder_path, file)
+        known = manifest.get(file)
+        stat_entry = file_entry(file_path, with_hash=False)
+        if known and known['size'] == stat_entry['size'] and known['mtime_ns'] == stat_entry['mtime_ns']:
+            continue
+        stat_entry['sha256'] = file_sha256(file_path)
+        if known and known['sha256'] == stat_entry['sha256']:
+            manifest[file] = stat_entry
+            continue
+        to_read.append((file, stat_entry))
+
+    if not to_read:
+        write_manifest(ingested_file_path, manifest)
+        logging.info("No new or changed files to ingest")
+        return
+
+    row_index = load_row_index(index_path, dataframe_output_path, data_format)
+    columns = dataset.dataset_columns(dataframe_output_path, data_format)
+    appended = 0
+
+    # Statistics cached for the dataset as it is before this run, or rebuilt once if stale
+    accumulators = summarystats.load_accumulators(dataframe_output_path, data_format)
+    if accumulators is None:
+        accumulators = summarystats.rebuild_summary(dataframe_output_path, data_format)
+
+    for file, entry in to_read:
+        file_path = os.path.join(input_folder_path, file)
+        df = pd.read_csv(file_path)
+        logging.info(f"Read file {file_path}")
+        if sorted(df.columns) != sorted(columns):
+            raise ValueError(f"Columns of {file_path} do not match {dataframe_output_path}: {list(df.columns)}")
+        df = df[columns]
+
+        # Keep rows not already in the dataset and not repeated within this file
+        hashes = row_hashes(df)
+        keep = ~np.isin(hashes, row_index) & ~pd.Series(hashes).duplicated().to_numpy()
+        new_rows = df[keep]
+
+        dataset.write_dataset(new_rows, dataframe_output_path, data_format=data_format,
+                              csv_export=csv_export, append=True)
+        row_index = np.union1d(row_index, hashes[keep])
+        summarystats.merge_into(accumulators, new_rows)
+        appended += len(new_rows)
+        manifest[file] = entry
+        logging.info(f"Appended {len(new_rows)} new rows from {file} ({len(df) - len(new_rows)} duplicates)")
+
+    save_row_index(index_path, row_index)
+    summarystats.save_summary(dataframe_output_path, accumulators, data_format)
+    write_manifest(ingested_file_path, manifest)
+    logging.info(f"Appended {appended} rows to {dataframe_output_path}")
+    logging.info(f"Recorded ingested files to {ingested_file_path}")
+
+
+# Function to report the process's peak resident set size in MB (lifetime high-water mark, never decreases)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class SeenRowHashes:
+    """Set of row hashes that starts in memory and spills to SQLite past ``memory_limit`` entries"""
+    def __init__(self, spill_path, memory_limit=2000000):
+        self.spill_path = spill_path
+        self.memory_limit = memory_limit
+        self._memory = set()
+        self._db = None
+
+    @property
+    def spilled(self):
+        return self._db is not None
+
+    def _spill(self):
+        logging.info(f"Seen-set passed {self.memory_limit} rows, spilling to {self.spill_path}")
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self._db = sqlite3.connect(self.spill_path)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE seen (h INTEGER PRIMARY KEY)')
+        self._db.execute('CREATE TEMP TABLE chunk (h INTEGER)')
+        self._insert(self._memory)
+        self._memory = set()
+
+    def _insert(self, hashes):
+        self._db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((h,) for h in hashes))
+
+    def filter_new(self, hashes):
+        """Return a mask of hashes not seen before (first occurrence within the batch wins) and record them"""
+        # SQLite integers are signed, so hashes are stored as int64
+        hashes = hashes.view(np.int64)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        if self._db is None:
+            seen = self._memory
+            keep &= np.fromiter((h not in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            seen.update(hashes[keep].tolist())
+            if len(seen) > self.memory_limit:
+                self._spill()
+        else:
+            candidates = hashes[keep].tolist()
+            self._db.execute('DELETE FROM chunk')
+            self._db.executemany('INSERT INTO chunk VALUES (?)', ((h,) for h in candidates))
+            existing = {row[0] for row in self._db.execute('SELECT chunk.h FROM chunk JOIN seen ON chunk.h = seen.h')}
+            keep &= np.fromiter((h not in existing for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            self._insert(hashes[keep].tolist())
+        return keep
+
+    def to_array(self):
+        if self._db is None:
+            return np.fromiter(self._memory, dtype=np.int64, count=len(self._memory)).view(np.uint64)
+        return np.array([row[0] for row in self._db.execute('SELECT h FROM seen')], dtype=np.int64).view(np.uint64)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self.spill_path)
+
+
+# Function for streaming data ingestion
+def merge_streaming(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                    data_format='csv', csv_export=True, chunk_size=100000, seen_set_limit=2000000):
+    """Rebuild the consolidated dataset reading each source file in ``chunk_size`` row chunks.
+
+    Output is written chunk by chunk to a staging dataset that replaces the old one
+    at the end, and duplicates are dropped with a row-hash seen-set, so peak memory
+    depends on the chunk size rather than the total volume (plus the seen-set, which
+    moves to SQLite once it holds more than ``seen_set_limit`` hashes). Output rows
+    and their order match the full mode's concat + drop_duplicates, since both read
+    the source files in sorted name order.
+
+    The logged peak RSS is the process-wide high-water mark; the growth over it
+    during this run is logged alongside, since earlier work in the process can
+    already have set a higher peak.
+    """
+    filenames = sorted(f for f in os.listdir(input_folder_path) if f.endswith('.csv'))
+    logging.info(f"Found {len(filenames)} files in {input_folder_path}")
+
+    staged_path = dataset.staging_path(dataframe_output_path)
+    seen = SeenRowHashes(os.path.join(output_folder_path, 'seenrows.sqlite'), seen_set_limit)
+    columns = None
+    accumulators = None
+    written = 0
+    manifest = {}
+    rss_at_start = peak_rss_mb()
+
+    try:
         for file in filenames:
-            if file.endswith('.csv'):
-                f.write(f"{file}\n")
+            file_path = os.path.join(input_folder_path, file)
+            start = time.perf_counter()
+            rows_read = 0
+            rows_kept = 0
+
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+                if columns is None:
+                    columns = list(chunk.columns)
+                elif sorted(chunk.columns) != sorted(columns):
+                    raise ValueError(f"Columns of {file_path} do not match earlier files: {list(chunk.columns)}")
+                chunk = chunk[columns]
+                rows_read += len(chunk)
+
+                new_rows = chunk[seen.filter_new(row_hashes(chunk))]
+                if new_rows.empty and written > 0:
+                    continue
+                dataset.write_dataset(new_rows, staged_path, data_format=data_format,
+                                      csv_export=csv_export, append=written > 0)
+                written += len(new_rows)
+                rows_kept += len(new_rows)
+
+                # Statistics are folded in chunk by chunk like the data itself
+                if accumulators is None:
+                    accumulators = summarystats.accumulate(new_rows)
+                else:
+                    summarystats.merge_into(accumulators, new_rows)
+
+            elapsed = time.perf_counter() - start
+            manifest[file] = file_entry(file_path)
+            rss = peak_rss_mb()
+            logging.info(
+                f"Streamed {file_path}: {rows_read} rows, {rows_kept} new, "
+                f"{rows_read / elapsed if elapsed > 0 else float('inf'):.0f} rows/s, "
+                f"process peak RSS {f'{rss:.1f} MB (+{rss - rss_at_start:.1f} MB this run)' if rss is not None else 'n/a'}"
+            )
+
+        if columns is None:
+            raise ValueError(f"No CSV files found in {input_folder_path}")
+
+        dataset.publish_dataset(staged_path, dataframe_output_path, data_format=data_format, csv_export=csv_export)
+        logging.info(f"Saved final dataframe to {dataframe_output_path} ({written} rows)")
+        summarystats.save_summary(dataframe_output_path, accumulators, data_format)
+
+        # Keep the row index for incremental runs; a spilled seen-set is too large to load as one array
+        index_path = os.path.join(output_folder_path, ROW_INDEX_FILE)
+        if seen.spilled:
+            if os.path.exists(index_path):
+                os.remove(index_path)
+        else:
+            save_row_index(index_path, seen.to_array())
+    finally:
+        seen.close()
+
+    write_manifest(ingested_file_path, manifest)
     logging.info(f"Recorded ingested files to {ingested_file_path}")
 
+
+# Function to run ingestion in the configured mode
+def ingest_data(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path, mode='full',
+                data_format='csv', csv_export=True, chunk_size=100000, seen_set_limit=2000000,
+                workers=1, csv_engine='c'):
+    if mode == 'streaming':
+        return merge_streaming(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                               data_format=data_format, csv_export=csv_export,
+                               chunk_size=chunk_size, seen_set_limit=seen_set_limit)
+    if mode == 'incremental':
+        return merge_new_files(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                               data_format=data_format, csv_export=csv_export)
+    if mode == 'full':
+        return merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                                        data_format=data_format, csv_export=csv_export,
+                                        workers=workers, csv_engine=csv_engine)
+    raise ValueError(f"Unknown ingestion mode: {mode}")
+
 if __name__ == '__main__':
     # Load config.json and get input and output paths
-    with open('config.json','r') as f:
-        config = json.load(f) 
+    config = settings.get_config()
 
     input_folder_path = config['input_folder_path']
     output_folder_path = config['output_folder_path']
@@ -51,5 +368,12 @@ if __name__ == '__main__':
     ingested_file_path = os.path.join(output_folder_path, 'ingestedfiles.txt')
 
     logging.info("Starting data ingestion process")
-    merge_multiple_dataframe(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path)
+    ingest_data(input_folder_path, output_folder_path, dataframe_output_path, ingested_file_path,
+                mode=config.get('ingestion_mode', 'full'),
+                data_format=config.get('dataset_format', 'csv'),
+                csv_export=config.get('csv_export', True),
+                chunk_size=config.get('chunk_size', 100000),
+                seen_set_limit=config.get('seen_set_limit', 2000000),
+                workers=config.get('ingestion_workers', 1),
+                csv_engine=config.get('csv_engine', 'c'))
     logging.info("Data ingestion process completed")
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking (Windows): fine for the single-process development server
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+class JobRunner:
+    """Runs named background jobs on a bounded thread pool.
+
+    At most one job per name is in flight: submitting while one is pending or
+    running returns that job instead of starting another. The result of the
+    last successful job per name is kept so callers can be answered at once.
+
+    With a ``state_path`` the job table lives in that JSON file, guarded by a
+    file lock, so every process serving the API (gunicorn workers) shares the
+    same jobs and results; a job still runs in the process that started it.
+    Without one the table is kept in memory.
+    """
+    def __init__(self, max_workers=2, max_jobs=100, state_path=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._memory = self._empty_state()
+        self.max_jobs = max_jobs
+        self.state_path = state_path
+        if state_path is not None:
+            os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+
+    @staticmethod
+    def _empty_state():
+        # Job records by id (oldest first), and job ids by name
+        return {'jobs': {}, 'in_flight': {}, 'latest': {}}
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return self._empty_state()
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable job state {self.state_path}: {str(e)}")
+            return self._empty_state()
+
+    def _write_state(self, state):
+        temporary = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.state_path)
+
+    @contextmanager
+    def _state(self, write=True):
+        """The job table, locked against other threads and processes; changes are saved on exit"""
+        with self._lock:
+            if self.state_path is None:
+                yield self._memory
+                return
+            with open(self.state_path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+                try:
+                    state = self._read_state()
+                    yield state
+                    if write:
+                        self._write_state(state)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _public(self, job):
+        info = dict(job)
+        if job['finished_at'] is not None:
+            info['age_seconds'] = time.time() - job['finished_at']
+        return info
+
+    def _in_flight_job(self, state, name):
+        job_id = state['in_flight'].get(name)
+        if job_id is None:
+            return None
+        job = state['jobs'].get(job_id)
+        if job is not None and job['finished_at'] is None and _process_alive(job['pid']):
+            return job
+        # The process running it exited (a worker restart) before the job finished
+        if job is not None and job['finished_at'] is None:
+            job.update(status='failed', error=f"Worker {job['pid']} exited before the job finished",
+                       finished_at=time.time())
+        del state['in_flight'][name]
+        return None
+
+    def submit(self, name, fn):
+        """Start fn in the background under name, or join the job already running for it"""
+        with self._state() as state:
+            job = self._in_flight_job(state, name)
+            if job is not None:
+                return self._public(job)
+
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'name': name,
+                'status': 'pending',
+                'pid': os.getpid(),
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            state['jobs'][job['job_id']] = job
+            state['in_flight'][name] = job['job_id']
+            # Forget the oldest finished jobs beyond max_jobs (the latest result per name is kept)
+            keep = set(state['in_flight'].values()) | set(state['latest'].values())
+            for job_id in list(state['jobs']):
+                if len(state['jobs']) <= self.max_jobs:
+                    break
+                if job_id not in keep and state['jobs'][job_id]['finished_at'] is not None:
+                    del state['jobs'][job_id]
+
+        self._executor.submit(self._run, job['job_id'], fn)
+        return self._public(job)
+
+    def _update(self, job_id, **fields):
+        with self._state() as state:
+            job = state['jobs'].get(job_id)
+            if job is not None:
+                job.update(fields)
+            return job
+
+    def _run(self, job_id, fn):
+        self._update(job_id, status='running', started_at=time.time())
+        try:
+            result = fn()
+            if self.state_path is not None:
+                # Fails here, as a failed job, rather than when the table is saved
+                json.dumps(result)
+            fields = {'result': result, 'status': 'succeeded'}
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            fields = {'error': str(e), 'status': 'failed'}
+        with self._state() as state:
+            job = state['jobs'].get(job_id)
+            if job is None:
+                return
+            job.update(fields, finished_at=time.time())
+            if state['in_flight'].get(job['name']) == job_id:
+                del state['in_flight'][job['name']]
+            if job['status'] == 'succeeded':
+                state['latest'][job['name']] = job_id
+
+    def get(self, job_id):
+        with self._state(write=False) as state:
+            job = state['jobs'].get(job_id)
+            return self._public(job) if job is not None else None
+
+    def latest(self, name):
+        """The most recent successful job for name (with its age), or None"""
+        with self._state(write=False) as state:
+            job = state['jobs'].get(state['latest'].get(name))
+            return self._public(job) if job is not None else None
+
+    def in_flight(self, name):
+        with self._state() as state:
+            job = self._in_flight_job(state, name)
+            return self._public(job) if job is not None else None
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import settings
+from benchmark import REGRESSION_THRESHOLD, BASELINE_RUNS, read_history
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Load test runs, one JSON object per line, and the latest run on its own; kept next to the trained model
+HISTORY_FILE = 'loadtesthistory.jsonl'
+RESULT_FILE = 'loadtest.json'
+
+# Target name for running in-process through Flask's test client instead of over HTTP
+TEST_CLIENT = 'test-client'
+
+# Share of synthesized traffic per endpoint
+DEFAULT_MIX = {'prediction': 0.6, 'scoring': 0.2, 'summarystats': 0.15, 'diagnostics': 0.05}
+
+
+def endpoint_request(endpoint, config):
+    """The request the API clients send to an endpoint: {'method', 'path', 'json'}"""
+    if endpoint == 'prediction':
+        return {'method': 'POST', 'path': '/prediction',
+                'json': {'dataset_path': os.path.abspath(config['test_data_path'])}}
+    return {'method': 'GET', 'path': f'/{endpoint}', 'json': None}
+
+
+# Function to generate traffic at a target rate
+def synthesize(config, rps=10.0, duration=10.0, mix=DEFAULT_MIX, seed=0):
+    """Evenly spaced requests at rps for duration seconds, endpoints drawn from mix"""
+    rng = np.random.default_rng(seed)
+    endpoints = list(mix)
+    weights = np.asarray([mix[endpoint] for endpoint in endpoints], dtype=np.float64)
+    choices = rng.choice(len(endpoints), size=int(rps * duration), p=weights / weights.sum())
+    schedule = []
+    for i, choice in enumerate(choices):
+        request = endpoint_request(endpoints[choice], config)
+        request['offset'] = i / rps
+        schedule.append(request)
+    return schedule
+
+
+def read_log(log_path, rps=None):
+    """Requests from a JSONL log, one {"method", "path", "json", "offset"} object per line.
+
+    ``offset`` (seconds from the start) keeps the recorded timing; lines
+    without one, or every line when rps is given, are spaced at rps.
+    """
+    schedule = []
+    with open(log_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            request = {'method': entry.get('method', 'GET').upper(), 'path': '/' + entry['path'].lstrip('/'),
+                       'json': entry.get('json'), 'offset': entry.get('offset')}
+            if rps or request['offset'] is None:
+                request['offset'] = len(schedule) / (rps or 10.0)
+            schedule.append(request)
+    return schedule
+
+
+def write_log(schedule, log_path):
+    with open(log_path, 'w') as f:
+        for request in schedule:
+            f.write(json.dumps(request) + '\n')
+
+
+class HTTPTransport:
+    """Sends requests to a running server (gunicorn wsgi:app, or app.py) over a pooled session"""
+    def __init__(self, base_url, pool_size=8, timeout=30):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def send(self, request):
+        response = self.session.request(request['method'], self.base_url + request['path'],
+                                        json=request['json'], timeout=self.timeout)
+        return response.status_code
+
+    def close(self):
+        self.session.close()
+
+
+class TestClientTransport:
+    """Sends requests through Flask's test client, in this process (one client per thread)"""
+    def __init__(self):
+        import app
+        self.app = app.app
+        self._local = threading.local()
+
+    def send(self, request):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.open(request['path'], method=request['method'], json=request['json']).status_code
+
+    def close(self):
+        pass
+
+
+def _timed_send(transport, request, scheduled_at):
+    try:
+        status = transport.send(request)
+        error = None
+    except Exception as e:
+        status, error = None, type(e).__name__
+    # Measured from the scheduled send time, so time spent waiting for a free worker counts too
+    return request['path'].lstrip('/'), status, error, time.perf_counter() - scheduled_at
+
+
+def _latency_stats(seconds):
+    milliseconds = np.asarray(seconds, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'mean_ms': float(milliseconds.mean()), 'max_ms': float(milliseconds.max())}
+
+
+def summarize_results(samples, elapsed):
+    """Throughput, latency percentiles and error rate per endpoint and overall"""
+    def stats(group):
+        errors = sum(1 for _, status, error, _ in group if error is not None or status >= 400)
+        return {
+            'requests': len(group),
+            'throughput_rps': len(group) / elapsed if elapsed else 0.0,
+            'error_rate': errors / len(group),
+            'status_codes': dict(Counter(str(status if error is None else error) for _, status, error, _ in group)),
+            **_latency_stats([seconds for _, _, _, seconds in group])
+        }
+
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample[0], []).append(sample)
+    return {
+        'endpoints': {endpoint: stats(group) for endpoint, group in sorted(endpoints.items())},
+        'overall': stats(samples) if samples else {}
+    }
+
+
+# Function to replay a request schedule against the API
+def run_load(schedule, target=TEST_CLIENT, concurrency=8):
+    """Send every request at its offset (open loop) from a pool of concurrency workers.
+
+    A slow server doesn't slow the sender down: requests keep being issued on
+    schedule and queue for a worker, as they would in production.
+    """
+    transport = TestClientTransport() if target == TEST_CLIENT else HTTPTransport(target, pool_size=concurrency)
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='loadtest') as executor:
+            start = time.perf_counter()
+            for request in sorted(schedule, key=lambda request: request['offset']):
+                scheduled_at = start + request['offset']
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(_timed_send, transport, request, scheduled_at))
+            samples = [future.result() for future in futures]
+            elapsed = time.perf_counter() - start
+    finally:
+        transport.close()
+    return summarize_results(samples, elapsed), elapsed
+
+
+def compare(result, baseline, threshold=REGRESSION_THRESHOLD):
+    """Endpoints whose p95 latency grew by more than threshold x, or whose error rate went up"""
+    regressions = []
+    for endpoint, stats in result['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint)
+        if previous is None:
+            continue
+        if stats['p95_ms'] > previous['p95_ms'] * threshold:
+            regressions.append({'endpoint': endpoint, 'metric': 'p95_ms',
+                                'baseline': previous['p95_ms'], 'current': stats['p95_ms']})
+        if stats['error_rate'] > previous['error_rate']:
+            regressions.append({'endpoint': endpoint, 'metric': 'error_rate',
+                                'baseline': previous['error_rate'], 'current': stats['error_rate']})
+    return regressions
+
+
+def baseline_from_history(result, history):
+    """Per-endpoint median p95 and error rate of the last BASELINE_RUNS comparable runs (same target kind and rate)"""
+    comparable = [run for run in history
+                  if run.get('target_kind') == result['target_kind'] and run.get('rps') == result['rps']][-BASELINE_RUNS:]
+    endpoints = {}
+    for endpoint in result['endpoints']:
+        previous = [run['endpoints'][endpoint] for run in comparable if endpoint in run['endpoints']]
+        if previous:
+            endpoints[endpoint] = {
+                'p95_ms': float(np.median([stats['p95_ms'] for stats in previous])),
+                'error_rate': float(np.median([stats['error_rate'] for stats in previous]))
+            }
+    return {'endpoints': endpoints}
+
+
+# Function to run a load test and record it for comparison with earlier runs
+def load_test(config, schedule, target=TEST_CLIENT, concurrency=8, mode='synthetic', rps=None, output_path=None):
+    if output_path is None:
+        output_path = config['output_model_path']
+
+    logging.info(f"Sending {len(schedule)} requests to {target} ({mode}, {concurrency} workers)...")
+    summary, elapsed = run_load(schedule, target, concurrency)
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'target': target,
+        'target_kind': 'test-client' if target == TEST_CLIENT else 'http',
+        'mode': mode,
+        'rps': rps,
+        'concurrency': concurrency,
+        'duration_seconds': elapsed,
+        **summary
+    }
+
+    history_path = os.path.join(output_path, HISTORY_FILE)
+    result['regressions'] = compare(result, baseline_from_history(result, read_history(history_path)))
+    for regression in result['regressions']:
+        logging.warning(f"Regression in {regression['endpoint']} {regression['metric']}: "
+                        f"{regression['current']:.4g} vs baseline {regression['baseline']:.4g}")
+
+    os.makedirs(output_path, exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    with open(os.path.join(output_path, RESULT_FILE), 'w') as f:
+        json.dump(result, f, indent=4)
+    return result
+
+
+def format_result(result):
+    lines = [f"{'endpoint':<16} {'requests':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"]
+    for endpoint, stats in list(result['endpoints'].items()) + [('overall', result['overall'])]:
+        if stats:
+            lines.append(f"{endpoint:<16} {stats['requests']:>8} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>9.1f} "
+                         f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['error_rate']:>7.1%}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    config = settings.get_config()
+    rps = float(config.get('loadtest_rps', 10))
+    concurrency = int(config.get('loadtest_concurrency', 8))
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+
+    if command == 'run':
+        target = sys.argv[2] if len(sys.argv) > 2 else config.get('loadtest_target', TEST_CLIENT)
+        schedule = synthesize(config, rps, float(config.get('loadtest_duration', 10)),
+                              config.get('loadtest_mix', DEFAULT_MIX))
+        print(format_result(load_test(config, schedule, target, concurrency, 'synthetic', rps)))
+    elif command == 'replay' and len(sys.argv) > 2:
+        target = sys.argv[3] if len(sys.argv) > 3 else config.get('loadtest_target', TEST_CLIENT)
+        print(format_result(load_test(config, read_log(sys.argv[2]), target, concurrency, 'replay')))
+    elif command == 'record' and len(sys.argv) > 2:
+        write_log(synthesize(config, rps, float(config.get('loadtest_duration', 10)),
+                             config.get('loadtest_mix', DEFAULT_MIX)), sys.argv[2])
+    elif command == 'compare' and len(sys.argv) > 3:
+        with open(sys.argv[2], 'r') as f:
+            baseline = json.load(f)
+        with open(sys.argv[3], 'r') as f:
+            current = json.load(f)
+        print(json.dumps(compare(current, baseline), indent=4))
+    else:
+        print("Usage: python loadtest.py [run [url | test-client] | replay <log.jsonl> [url | test-client] | "
+              "record <log.jsonl> | compare <baseline.json> <current.json>]")
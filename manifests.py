@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+
+# Manifest and checksum helpers with no heavy dependencies, so entry points can
+# read them without importing pandas
+
+# Checksums of every file deployment placed in the production directory
+DEPLOYMENT_MANIFEST = 'deploymentmanifest.json'
+
+
+# Function to hash a file's contents
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to describe a source file for the manifest
+def file_entry(file_path, with_hash=True):
+    stat = os.stat(file_path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_sha256(file_path) if with_hash else None
+    }
+
+
+# Function to read ingestedfiles.txt
+def read_manifest(ingested_file_path):
+    """Return {filename: {'size', 'mtime_ns', 'sha256'}} from an ingested-files manifest.
+
+    Lines are tab-separated ``name size mtime_ns sha256``; legacy manifests with
+    only a file name per line are accepted and their other fields are None.
+    """
+    manifest = {}
+    if not os.path.exists(ingested_file_path):
+        return manifest
+    with open(ingested_file_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not fields[0].strip():
+                continue
+            if len(fields) >= 4:
+                manifest[fields[0]] = {'size': int(fields[1]), 'mtime_ns': int(fields[2]), 'sha256': fields[3]}
+            else:
+                manifest[fields[0].strip()] = {'size': None, 'mtime_ns': None, 'sha256': None}
+    return manifest
+
+
+# Function to write ingestedfiles.txt
+def write_manifest(ingested_file_path, manifest):
+    with open(ingested_file_path, 'w') as f:
+        for name in sorted(manifest):
+            entry = manifest[name]
+            if entry['sha256'] is None:
+                # Legacy entry whose file has not been seen since; keep the bare name
+                f.write(f"{name}\n")
+            else:
+                f.write(f"{name}\t{entry['size']}\t{entry['mtime_ns']}\t{entry['sha256']}\n")
+
+
+# Function to read deploymentmanifest.json
+def read_deployment_manifest(prod_deployment_path):
+    manifest_path = os.path.join(prod_deployment_path, DEPLOYMENT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def expected_checksum(prod_deployment_path, name):
+    """sha256 the deployment manifest records for name, or None if it wasn't deployed with one"""
+    manifest = read_deployment_manifest(prod_deployment_path)
+    if manifest is None or name not in manifest['files']:
+        return None
+    return manifest['files'][name]['sha256']
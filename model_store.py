@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import logging
+import settings
+import manifests
+import numpy as np
+import inference
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Versioned model store, kept under the production deployment directory:
+#   versions/<version>/{coef,intercept,classes}.npy, model.pkl, manifest.json
+#   versions/CURRENT      name of the live version (replaced atomically)
+#   versions/history.jsonl  one line per activation, for rollback
+STORE_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+HISTORY_FILE = 'history.jsonl'
+MANIFEST_FILE = 'manifest.json'
+MODEL_FILE = 'model.pkl'
+
+
+def store_path(prod_deployment_path):
+    return os.path.join(prod_deployment_path, STORE_DIR)
+
+
+def _write_atomic(path, text):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to add a model to the store
+def publish(model_path, store, metrics=None, data_fingerprint=None, feature_columns=inference.FEATURE_COLUMNS,
+            extra_files=()):
+    """Write the pickled model at model_path as a new version directory and return its name.
+
+    The version is named after the pickle's content hash, so publishing the
+    same model twice reuses the existing directory. ``extra_files`` are the
+    other deployed files belonging to this model (array artifact, drift
+    reference, score, training state); they are kept with the version so a
+    rollback can put them back. Nothing is activated.
+    """
+    model_sha256 = _sha256(model_path)
+    version = model_sha256[:16]
+    version_path = os.path.join(store, version)
+    if os.path.exists(os.path.join(version_path, MANIFEST_FILE)):
+        logging.info(f"Model version {version} already in the store")
+        return version
+
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    arrays = inference.model_to_arrays(model, feature_columns)
+
+    # Build in a scratch directory and rename it in, so a version directory is always complete
+    staging = version_path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    shutil.copyfile(model_path, os.path.join(staging, MODEL_FILE))
+    # Deployed file name -> file in the version directory
+    deployed_files = {os.path.basename(model_path): MODEL_FILE}
+    for path in extra_files:
+        shutil.copyfile(path, os.path.join(staging, os.path.basename(path)))
+        deployed_files[os.path.basename(path)] = os.path.basename(path)
+    np.save(os.path.join(staging, 'coef.npy'), arrays.coef)
+    np.save(os.path.join(staging, 'intercept.npy'), np.array([arrays.intercept]))
+    np.save(os.path.join(staging, 'classes.npy'), arrays.classes)
+
+    manifest = {
+        'version': version,
+        'model_sha256': model_sha256,
+        'files': {name: _sha256(os.path.join(staging, name)) for name in sorted(os.listdir(staging))},
+        'deployed_files': deployed_files,
+        'created_at': time.time(),
+        'model_type': type(model).__name__,
+        'feature_columns': list(feature_columns),
+        'metrics': metrics or {},
+        'data_fingerprint': data_fingerprint
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(staging, version_path)
+    logging.info(f"Published model version {version} to {store}")
+    return version
+
+
+def read_manifest(store, version):
+    with open(os.path.join(store, version, MANIFEST_FILE), 'r') as f:
+        return json.load(f)
+
+
+def verify(store, version):
+    """Raise ValueError if any file of version doesn't match the checksum in its manifest"""
+    manifest = read_manifest(store, version)
+    for name, checksum in manifest.get('files', {}).items():
+        if _sha256(os.path.join(store, version, name)) != checksum:
+            raise ValueError(f"Checksum mismatch for {name} in model version {version}")
+    return manifest
+
+
+def current_version(store):
+    current_path = os.path.join(store, CURRENT_FILE)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path, 'r') as f:
+        return f.read().strip() or None
+
+
+def read_history(store):
+    history_path = os.path.join(store, HISTORY_FILE)
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def activation_stack(store):
+    """Versions that have been live, oldest first, with rolled-back activations popped off"""
+    stack = []
+    for entry in read_history(store):
+        if entry.get('action') == 'rollback':
+            if stack:
+                stack.pop()
+            if not stack or stack[-1] != entry['version']:
+                stack.append(entry['version'])
+        else:
+            stack.append(entry['version'])
+    return stack
+
+
+def activate(store, version, action='activate'):
+    """Point CURRENT at version (one atomic rename) and record it in the history"""
+    if not os.path.exists(os.path.join(store, version, MANIFEST_FILE)):
+        raise FileNotFoundError(f"Unknown model version: {version}")
+    _write_atomic(os.path.join(store, CURRENT_FILE), version + '\n')
+    with open(os.path.join(store, HISTORY_FILE), 'a') as f:
+        f.write(json.dumps({'version': version, 'action': action, 'activated_at': time.time()}) + '\n')
+    logging.info(f"Activated model version {version}")
+    return version
+
+
+def restore_deployment(store, version):
+    """Copy a version's files back over the flat deployment directory the store lives in.
+
+    Scoring, reporting, drift and training read production_deployment/ directly,
+    so after a rollback they have to see the same model the API serves.
+    Each file is replaced atomically and the deployment manifest updated.
+    """
+    manifest = verify(store, version)
+    prod_deployment_path = os.path.dirname(os.path.abspath(store))
+    deployment_manifest = manifests.read_deployment_manifest(prod_deployment_path) or {'files': {}}
+    deployed_files = manifest.get('deployed_files')
+    if deployed_files is None:
+        # Published before versions kept their deployed files: only the pickle can be restored,
+        # and the array artifact of the newer model must not stay next to it
+        deployed_files = {'trainedmodel.pkl': MODEL_FILE}
+        arrays_path = os.path.join(prod_deployment_path, inference.ARRAYS_FILE)
+        if os.path.exists(arrays_path):
+            os.remove(arrays_path)
+        deployment_manifest['files'].pop(inference.ARRAYS_FILE, None)
+        logging.warning(f"Model version {version} has no deployed files recorded, restoring the pickle only")
+    for deployed_name, stored_name in deployed_files.items():
+        destination = os.path.join(prod_deployment_path, deployed_name)
+        checksum = manifest['files'][stored_name]
+        if not (os.path.exists(destination) and _sha256(destination) == checksum):
+            temporary = destination + '.tmp'
+            shutil.copyfile(os.path.join(store, version, stored_name), temporary)
+            with open(temporary, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(temporary, destination)
+        deployment_manifest['files'][deployed_name] = {'sha256': checksum, 'size': os.path.getsize(destination)}
+    deployment_manifest['deployed_at'] = time.time()
+    _write_atomic(os.path.join(prod_deployment_path, manifests.DEPLOYMENT_MANIFEST),
+                  json.dumps(deployment_manifest, indent=4))
+    logging.info(f"Restored deployed files of model version {version}")
+
+
+def rollback(store, version=None):
+    """Re-activate version, or the version that was live before the current one.
+
+    Repeated rollbacks keep stepping back through earlier activations.
+    """
+    if version is None:
+        stack = activation_stack(store)
+        if len(stack) < 2:
+            raise ValueError("No earlier version to roll back to")
+        version, action = stack[-2], 'rollback'
+    else:
+        action = 'activate'
+    restore_deployment(store, version)
+    return activate(store, version, action)
+
+
+def list_versions(store):
+    """Manifests of every version in the store, oldest first"""
+    if not os.path.isdir(store):
+        return []
+    manifests = [read_manifest(store, name) for name in os.listdir(store)
+                 if os.path.exists(os.path.join(store, name, MANIFEST_FILE))]
+    return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+
+def load_arrays(store, version, mmap=True):
+    """LinearModelArrays for a version; with mmap the .npy files are mapped read-only,
+    so every worker process shares the same page-cache copy"""
+    version_path = os.path.join(store, version)
+    manifest = read_manifest(store, version)
+    mmap_mode = 'r' if mmap else None
+    return inference.LinearModelArrays(
+        coef=np.load(os.path.join(version_path, 'coef.npy'), mmap_mode=mmap_mode),
+        intercept=float(np.load(os.path.join(version_path, 'intercept.npy'))[0]),
+        classes=np.load(os.path.join(version_path, 'classes.npy'), mmap_mode=mmap_mode),
+        feature_columns=manifest['feature_columns']
+    )
+
+
+def load_model(store, version):
+    with open(os.path.join(store, version, MODEL_FILE), 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    config = settings.get_config()
+    store = store_path(config['prod_deployment_path'])
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'list':
+        current = current_version(store)
+        for manifest in list_versions(store):
+            marker = '*' if manifest['version'] == current else ' '
+            print(f"{marker} {manifest['version']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created_at']))}  "
+                  f"{json.dumps(manifest['metrics'])}")
+    elif command == 'rollback':
+        rollback(store, sys.argv[2] if len(sys.argv) > 2 else None)
+    elif command == 'activate':
+        restore_deployment(store, sys.argv[2])
+        activate(store, sys.argv[2])
+    else:
+        print("Usage: python model_store.py [list | rollback [version] | activate <version>]")
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Stage outcomes that let dependent stages run
+COMPLETED = ('ran', 'cached')
+
+
+class Stage:
+    """One step of the pipeline.
+
+    ``inputs`` are files or directories whose contents (together with ``params``)
+    form the stage's cache key; ``outputs`` are the files it produces. A stage
+    with no outputs, or with ``cacheable=False``, always runs. ``after`` names
+    the stages it depends on. If ``fn`` returns False the stage is a closed
+    gate and its dependents are skipped.
+    """
+    def __init__(self, name, fn, inputs=(), outputs=(), after=(), params=None, cacheable=True):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.params = params or {}
+        self.cacheable = cacheable and bool(self.outputs)
+
+
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_key(stage):
+    """Content hash of a stage's name, params and input files"""
+    digest = hashlib.sha256()
+    digest.update(stage.name.encode())
+    digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+    for path in stage.inputs:
+        digest.update(f"\0{path}\0".encode())
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    digest.update(f"{os.path.relpath(file_path, path)}:{file_digest(file_path)}".encode())
+        elif os.path.exists(path):
+            digest.update(file_digest(path).encode())
+        else:
+            digest.update(b'<missing>')
+    return digest.hexdigest()
+
+
+def _copy_atomic(source, destination):
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    temporary = destination + '.tmp'
+    # copy2 keeps the mtime, which stat-based dataset fingerprints (summary cache) depend on
+    shutil.copy2(source, temporary)
+    os.replace(temporary, destination)
+
+
+def restore_outputs(stage, entry_path):
+    """Put a cached stage's outputs in place; False if the cache entry is missing or incomplete"""
+    meta_path = os.path.join(entry_path, 'outputs.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        outputs = json.load(f)
+    if sorted(output['path'] for output in outputs) != sorted(stage.outputs):
+        return False
+    for output in outputs:
+        cached_file = os.path.join(entry_path, output['file'])
+        if not os.path.exists(cached_file):
+            return False
+    for output in outputs:
+        # Outputs already identical on disk are left untouched
+        if os.path.exists(output['path']) and file_digest(output['path']) == output['sha256']:
+            continue
+        _copy_atomic(os.path.join(entry_path, output['file']), output['path'])
+    return True
+
+
+def store_outputs(stage, entry_path):
+    if not all(os.path.exists(path) for path in stage.outputs):
+        logging.warning(f"Stage {stage.name} did not produce all declared outputs, not caching")
+        return
+    staging = entry_path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    outputs = []
+    for i, path in enumerate(stage.outputs):
+        cached_name = f"{i}_{os.path.basename(path)}"
+        shutil.copy2(path, os.path.join(staging, cached_name))
+        outputs.append({'path': path, 'file': cached_name, 'sha256': file_digest(path)})
+    with open(os.path.join(staging, 'outputs.json'), 'w') as f:
+        json.dump(outputs, f, indent=4)
+    shutil.rmtree(entry_path, ignore_errors=True)
+    os.replace(staging, entry_path)
+
+
+def prune_cache(stage_dir, max_entries):
+    """Keep a stage's max_entries most recently used cache entries"""
+    entries = sorted((os.path.join(stage_dir, name) for name in os.listdir(stage_dir)
+                      if not name.endswith('.tmp')),
+                     key=os.path.getmtime, reverse=True)
+    for stale in entries[max_entries:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def run_stage(stage, cache_dir, max_entries=None):
+    record = {'stage': stage.name, 'status': None, 'seconds': None, 'cache_key': None}
+    start = time.perf_counter()
+    try:
+        entry_path = None
+        if stage.cacheable:
+            record['cache_key'] = input_key(stage)
+            entry_path = os.path.join(cache_dir, stage.name, record['cache_key'])
+            if restore_outputs(stage, entry_path):
+                # Marks the entry as recently used, so pruning drops the oldest keys first
+                os.utime(entry_path)
+                record['status'] = 'cached'
+                return record
+
+        result = stage.fn()
+        if result is False:
+            record['status'] = 'stopped'
+            return record
+
+        if entry_path is not None:
+            store_outputs(stage, entry_path)
+            if max_entries is not None:
+                # New input files rarely repeat a key, so without a limit every run adds a full copy
+                prune_cache(os.path.dirname(entry_path), max_entries)
+        record['status'] = 'ran'
+        return record
+    except Exception as e:
+        logging.error(f"Stage {stage.name} failed: {str(e)}")
+        record['status'] = 'failed'
+        record['error'] = str(e)
+        return record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+
+
+def run_pipeline(stages, cache_dir, max_workers=4, max_entries=None):
+    """Run stages in dependency order, independent ones in parallel; return the per-stage report.
+
+    max_entries caps the cache entries kept per stage (None keeps them all).
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        unknown = [name for name in stage.after if name not in by_name]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {unknown}")
+
+    status = {}
+    records = {}
+    pending = [stage.name for stage in stages]
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                dependencies = [status.get(dependency) for dependency in by_name[name].after]
+                if any(state is not None and state not in COMPLETED for state in dependencies):
+                    # An upstream stage failed, was skipped or closed its gate
+                    pending.remove(name)
+                    status[name] = 'skipped'
+                    records[name] = {'stage': name, 'status': 'skipped', 'seconds': 0.0, 'cache_key': None}
+                elif all(state in COMPLETED for state in dependencies):
+                    pending.remove(name)
+                    logging.info(f"Starting stage {name}")
+                    running[executor.submit(run_stage, by_name[name], cache_dir, max_entries)] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Dependency cycle between stages: {pending}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                record = future.result()
+                status[name] = record['status']
+                records[name] = record
+                logging.info(f"Stage {name}: {record['status']} in {record['seconds']:.3f}s")
+
+    return [records[stage.name] for stage in stages]
+
+
+def format_report(report):
+    lines = [f"{'stage':<12} {'status':<8} {'seconds':>8}"]
+    for record in report:
+        lines.append(f"{record['stage']:<12} {record['status']:<8} {record['seconds']:>8.3f}")
+    hits = sum(record['status'] == 'cached' for record in report)
+    cacheable = sum(record['cache_key'] is not None for record in report)
+    lines.append(f"cache hits: {hits}/{cacheable}")
+    return '\n'.join(lines)
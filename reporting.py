@@ -1,59 +1,85 @@
 import pickle
-from sklearn.model_selection import train_test_split
-import pandas as pd
 import numpy as np
-from sklearn import metrics
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json
 import os
+import sys
 import logging
-from diagnostics import model_predictions
+import inference
+import evaluation
+import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load config.json and get path variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = settings.get_config()
 
 prod_deployment_path = os.path.join(config['prod_deployment_path'])
 test_data_path = os.path.join(config['test_data_path'])
 output_model_path = os.path.join(config['output_model_path'])
 
+# Metrics written by the reporting stage, and the plot rendered from them on demand
+METRICS_FILE = 'reportmetrics.json'
+PLOT_FILE = 'confusionmatrix.png'
+
+
+def load_deployed_arrays(prod_deployment_path):
+    # The array artifact when deployed, otherwise the same arrays taken from the pickle
+    arrays_path = os.path.join(prod_deployment_path, inference.ARRAYS_FILE)
+    if os.path.exists(arrays_path):
+        return inference.load_model_arrays(arrays_path)
+    with open(os.path.join(prod_deployment_path, 'trainedmodel.pkl'), 'rb') as f:
+        return inference.model_to_arrays(pickle.load(f))
+
+
 # Function for reporting
 def score_model(output_model_path, prod_deployment_path, test_data_path):
     """
-    Calculate and save confusion matrix for the model performance
+    Calculate the deployed model's metrics on the test data and save them as JSON
     """
-    logging.info('Loading test data...')
-    # Load test data
-    test_data = pd.read_csv(os.path.join(test_data_path, 'testdata.csv'))
-    y_test = test_data['exited']
-    
-    logging.info('Getting model predictions...')
-    # Get model predictions
-    y_pred = model_predictions(test_data_path, prod_deployment_path)
-    
-    logging.info('Generating confusion matrix...')
-    # Generate confusion matrix
-    cm = metrics.confusion_matrix(y_test, y_pred)
-    
+    logging.info('Evaluating deployed model on test data...')
+    # Shared with the scoring stage and the API: the same model on the same data is evaluated once
+    arrays = load_deployed_arrays(prod_deployment_path)
+    report = evaluation.evaluate(arrays, os.path.join(test_data_path, 'testdata.csv')).metrics
+
+    os.makedirs(output_model_path, exist_ok=True)
+    metrics_path = os.path.join(output_model_path, METRICS_FILE)
+    with open(metrics_path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=4)
+    os.replace(metrics_path + '.tmp', metrics_path)
+    logging.info(f"Metrics saved to {metrics_path} (F1 {report['f1']:.4f}, AUC {report['roc_auc']})")
+    return report
+
+
+# Function to render the confusion matrix plot from saved metrics (out of band, not part of the pipeline)
+def render_plots(output_model_path):
+    # Plotting libraries are only imported here: they take seconds to load
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    with open(os.path.join(output_model_path, METRICS_FILE), 'r') as f:
+        report = json.load(f)
+
     logging.info('Creating confusion matrix plot...')
     # Create confusion matrix plot
     plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
+    sns.heatmap(np.array(report['confusion_matrix']), annot=True, fmt='d', cmap='Blues')
     plt.title('Confusion Matrix')
     plt.ylabel('True Label')
     plt.xlabel('Predicted Label')
-    
+
     logging.info('Saving confusion matrix plot...')
     # Save plot
-    plt.savefig(os.path.join(output_model_path, 'confusionmatrix.png'))
+    plt.savefig(os.path.join(output_model_path, PLOT_FILE))
     plt.close()
     logging.info('Confusion matrix plot saved successfully.')
 
 if __name__ == '__main__':
-    logging.info('Starting score_model function...')
-    score_model(output_model_path, prod_deployment_path, test_data_path)
-    logging.info('score_model function completed.')
+    if len(sys.argv) > 1 and sys.argv[1] == 'plot':
+        render_plots(output_model_path)
+    else:
+        logging.info('Starting score_model function...')
+        score_model(output_model_path, prod_deployment_path, test_data_path)
+        logging.info('score_model function completed.')
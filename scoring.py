@@ -1,45 +1,40 @@
 import os
-import pandas as pd
-import numpy as np
 import pickle
-from sklearn import metrics
-import json
 import logging
+import evaluation
+import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def score_model(output_model_path, test_data_path):
+def score_model(output_model_path, test_data_path, model=None):
     #this function should take a trained model, load test data, and calculate an F1 score for the model relative to the test data
     #it should write the result to the latestscore.txt file
+    #an already loaded model can be passed in to skip reading the pickle
 
     try:
-        logging.info("Loading the trained model from the output_model_path directory")
-        #load the trained model from the output_model_path directory
-        model_file = [f for f in os.listdir(output_model_path) if f.endswith('.pkl')][0]
-        model = pickle.load(open(os.path.join(output_model_path, model_file), 'rb'))
+        if model is None:
+            logging.info("Loading the trained model from the output_model_path directory")
+            #load the trained model from the output_model_path directory
+            model_file = [f for f in os.listdir(output_model_path) if f.endswith('.pkl')][0]
+            model = pickle.load(open(os.path.join(output_model_path, model_file), 'rb'))
         
         logging.info("Loading the test data from the test_data_path")
         #load the test data from the test_data_path
         test_file = [f for f in os.listdir(test_data_path) if f.endswith('.csv')][0]
-        test_data = pd.read_csv(os.path.join(test_data_path, test_file))
-        
-        # Add data validation
-        if test_data.empty:
-            logging.error("Test data is empty")
-            return None
-       
-        #define your X and y
-        X_test = test_data.drop(columns=['corporation', 'exited'], axis=1)
-        y_test = test_data['exited']
 
         logging.info("Predicting the test data")
-        #predict the test data
-        y_pred = model.predict(X_test)
+        #predict the test data; reporting and the API reuse this evaluation of the same model and data
+        result = evaluation.evaluate_model(model, os.path.join(test_data_path, test_file))
+
+        # Add data validation
+        if result.metrics is None:
+            logging.error("Test data has no 'exited' labels")
+            return None
 
         logging.info("Calculating the F1 score")
         #calculate the F1 score
-        score = metrics.f1_score(y_test, y_pred)
+        score = result.metrics['f1']
 
         logging.info("Writing the result to the latestscore.txt file")
         #write the result to the latestscore.txt file
@@ -58,7 +53,7 @@ def score_model(output_model_path, test_data_path):
     
 if __name__ == '__main__':
     logging.info("Starting model scoring...")
-    config = json.load(open('config.json', 'r'))
+    config = settings.get_config()
     output_model_path = config['output_model_path']
     test_data_path = config['test_data_path']
     
@@ -0,0 +1,13 @@
+import json
+from functools import lru_cache
+
+
+# Function to load config.json once per process
+@lru_cache(maxsize=None)
+def get_config(config_path='config.json'):
+    """The parsed config file, read on first use and shared by every module afterwards.
+
+    Callers must treat the returned dict as read-only.
+    """
+    with open(config_path, 'r') as f:
+        return json.load(f)
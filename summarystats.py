@@ -0,0 +1,169 @@
+import os
+import json
+import math
+import logging
+import numpy as np
+import dataset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Cached statistics, stored next to the consolidated dataset
+SUMMARY_FILE = 'summarystats.json'
+
+# In-process copy of the last cache file read, so repeated hits don't touch the disk
+_memo = {'path': None, 'fingerprint': None, 'statistics': None}
+
+
+class ColumnAccumulator:
+    """Mergeable running statistics for one numeric column.
+
+    Count, mean and the sum of squared deviations (M2) are combined with Chan et
+    al.'s parallel update, so batches can be folded in as they are ingested.
+    The median is exact: the accumulator keeps a count per distinct value, which
+    stays small for the low-cardinality integer columns in this dataset.
+    """
+    def __init__(self, count=0, mean=0.0, m2=0.0, value_counts=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.value_counts = value_counts if value_counts is not None else {}
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+        for value, n in other.value_counts.items():
+            self.value_counts[value] = self.value_counts.get(value, 0) + n
+        return self
+
+    def update(self, values):
+        """Fold a batch of values in; NaNs are skipped, as pandas does"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch_mean = float(values.mean())
+        distinct, counts = np.unique(values, return_counts=True)
+        batch = ColumnAccumulator(
+            count=len(values),
+            mean=batch_mean,
+            m2=float(((values - batch_mean) ** 2).sum()),
+            value_counts=dict(zip(distinct.tolist(), counts.tolist()))
+        )
+        return self.merge(batch)
+
+    def variance(self, ddof=1):
+        return self.m2 / (self.count - ddof) if self.count > ddof else float('nan')
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def median(self):
+        if self.count == 0:
+            return float('nan')
+        # Walk the sorted distinct values until the middle position(s) are reached
+        lower_position = (self.count - 1) // 2
+        upper_position = self.count // 2
+        lower = upper = None
+        seen = 0
+        for value in sorted(self.value_counts):
+            seen += self.value_counts[value]
+            if lower is None and seen > lower_position:
+                lower = value
+            if seen > upper_position:
+                upper = value
+                break
+        return (lower + upper) / 2
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'value_counts': [[value, n] for value, n in sorted(self.value_counts.items())]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'], {value: n for value, n in data['value_counts']})
+
+
+def accumulate(df, columns=None):
+    """Build accumulators for the numeric columns of df (or for ``columns``, in that order)"""
+    if columns is None:
+        columns = list(df.select_dtypes(include=[np.number]).columns)
+    return {column: ColumnAccumulator().update(df[column].to_numpy(dtype=np.float64)) for column in columns}
+
+
+def merge_into(accumulators, df):
+    for column, accumulator in accumulators.items():
+        accumulator.update(df[column].to_numpy(dtype=np.float64))
+    return accumulators
+
+
+def summary_list(accumulators):
+    """Flatten to [mean, median, std] per column, the shape dataframe_summary() returns"""
+    statistics = []
+    for accumulator in accumulators.values():
+        statistics.extend([accumulator.mean, accumulator.median(), accumulator.std()])
+    return statistics
+
+
+def summary_path(dataframe_path):
+    return os.path.join(os.path.dirname(dataframe_path), SUMMARY_FILE)
+
+
+def save_summary(dataframe_path, accumulators, data_format='csv'):
+    """Store accumulators keyed by the fingerprint of the dataset as it is now on disk"""
+    path = summary_path(dataframe_path)
+    payload = {
+        'fingerprint': dataset.dataset_fingerprint(dataframe_path, data_format),
+        'columns': {column: accumulator.to_dict() for column, accumulator in accumulators.items()}
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(payload, f)
+    os.replace(path + '.tmp', path)
+    _memo.update(path=path, fingerprint=payload['fingerprint'], statistics=summary_list(accumulators))
+    logging.info(f"Saved summary statistics to {path}")
+
+
+def load_accumulators(dataframe_path, data_format='csv'):
+    """Accumulators from the cache, or None if it is missing or was built for other data"""
+    path = summary_path(dataframe_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    if payload.get('fingerprint') != dataset.dataset_fingerprint(dataframe_path, data_format):
+        return None
+    return {column: ColumnAccumulator.from_dict(data) for column, data in payload['columns'].items()}
+
+
+def cached_summary(dataframe_path, data_format='csv'):
+    """Summary statistics list from the cache, or None when the dataset has changed since it was built"""
+    path = summary_path(dataframe_path)
+    fingerprint = dataset.dataset_fingerprint(dataframe_path, data_format)
+    if _memo['path'] == path and _memo['fingerprint'] == fingerprint:
+        return list(_memo['statistics'])
+
+    accumulators = load_accumulators(dataframe_path, data_format)
+    if accumulators is None:
+        return None
+    statistics = summary_list(accumulators)
+    _memo.update(path=path, fingerprint=fingerprint, statistics=statistics)
+    return list(statistics)
+
+
+def rebuild_summary(dataframe_path, data_format='csv'):
+    df = dataset.read_dataset(dataframe_path, numeric_only=True, data_format=data_format)
+    accumulators = accumulate(df)
+    save_summary(dataframe_path, accumulators, data_format)
+    return accumulators
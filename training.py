@@ -1,47 +1,189 @@
-from flask import Flask, session, jsonify, request
 import pandas as pd
 import numpy as np
 import pickle
 import os
 from sklearn import metrics
 from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+import sklearn
+import copy
+import time
 import json
 import logging
+import dataset
+import settings
+import ingestion
+from inference import FEATURE_COLUMNS
 
 # Load config.json and get path variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = settings.get_config()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Row hashes of the data a model was trained on, and the incremental-training state, kept next to the model
+TRAINED_ROWS_FILE = 'trainedrows.npy'
+TRAINING_STATE_FILE = 'trainingstate.json'
+
+# Function to build the production logistic regression (tuning.py searches over this same estimator)
+def make_model(params=None):
+    #use this logistic regression for training
+    model = LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
+                    intercept_scaling=1, l1_ratio=None, max_iter=100,
+                    multi_class='auto', n_jobs=None, penalty='l2',
+                    random_state=0, solver='liblinear', tol=0.0001, verbose=0,
+                    warm_start=False)
+    if params:
+        #use the hyperparameters picked by tuning.py instead of the defaults
+        model.set_params(**params)
+    return model
+
+# Function to fit a fresh logistic regression
+def fit_full_model(data, params=None):
+    model = make_model(params)
+
+    #define your X and y
+    X = data[FEATURE_COLUMNS]
+    y = data['exited']
+
+    #split the data into training and testing set
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    logging.info("Data split into training and testing sets")
+
+    #fit the logistic regression to your data
+    model.fit(X_train, y_train)
+    return model
+
+def _log_loss_name():
+    # SGDClassifier's logistic loss was renamed from 'log' to 'log_loss' in scikit-learn 1.1
+    major, minor = (int(part) for part in sklearn.__version__.split('.')[:2])
+    return 'log_loss' if (major, minor) >= (1, 1) else 'log'
+
+# Function to update a deployed model with new rows only
+def update_model(deployed_model, new_data, epochs=5, alpha=0.0001, eta0=0.01):
+    """SGD logistic-loss passes over new_data, starting from the deployed coefficients.
+
+    The optimization runs on standardized features (coefficients are mapped in
+    and back out), so the step size doesn't depend on the raw feature scales.
+    The result is a copy of the deployed model with updated coef_/intercept_.
+    """
+    X = new_data[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    y = new_data['exited'].to_numpy()
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+
+    coef = np.asarray(deployed_model.coef_, dtype=np.float64)
+    intercept = np.asarray(deployed_model.intercept_, dtype=np.float64)
+
+    learner = SGDClassifier(loss=_log_loss_name(), penalty='l2', alpha=alpha,
+                            learning_rate='constant', eta0=eta0, random_state=0)
+    learner.coef_ = coef * scale
+    learner.intercept_ = intercept + coef @ mean
+    X_scaled = (X - mean) / scale
+    for _ in range(epochs):
+        learner.partial_fit(X_scaled, y, classes=deployed_model.classes_)
+
+    model = copy.deepcopy(deployed_model)
+    model.coef_ = learner.coef_ / scale
+    model.intercept_ = learner.intercept_ - model.coef_ @ mean
+    return model
+
+def _holdout_accuracy(model):
+    test_data = pd.read_csv(os.path.join(config['test_data_path'], 'testdata.csv'))
+    return metrics.accuracy_score(test_data['exited'], model.predict(test_data[FEATURE_COLUMNS]))
+
+def read_training_state(state_path):
+    if not os.path.exists(state_path):
+        return {'updates_since_full_refit': 0}
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+def _incremental_model(data, hashes, deployed_model_path, full_refit_every):
+    """Warm-started model and the row hashes it has seen, or None when a full refit is due"""
+    deployed_rows_path = os.path.join(os.path.dirname(deployed_model_path), TRAINED_ROWS_FILE)
+    if not os.path.exists(deployed_model_path) or not os.path.exists(deployed_rows_path):
+        logging.info("No deployed model with a trained-rows index, running a full refit")
+        return None
+
+    state = read_training_state(os.path.join(os.path.dirname(deployed_model_path), TRAINING_STATE_FILE))
+    if state['updates_since_full_refit'] >= full_refit_every:
+        logging.info(f"{state['updates_since_full_refit']} incremental updates since the last full refit, running a full refit")
+        return None
+
+    with open(deployed_model_path, 'rb') as f:
+        deployed_model = pickle.load(f)
+    trained_rows = np.load(deployed_rows_path)
+    new_rows = ~np.isin(hashes, trained_rows)
+    logging.info(f"{int(new_rows.sum())} of {len(data)} rows are new since the last deployment")
+    if not new_rows.any():
+        return deployed_model, trained_rows, state['updates_since_full_refit']
+
+    model = update_model(deployed_model, data[new_rows],
+                         epochs=config.get('incremental_epochs', 5),
+                         alpha=config.get('incremental_alpha', 0.0001),
+                         eta0=config.get('incremental_learning_rate', 0.01))
+    return model, np.union1d(trained_rows, hashes[new_rows]), state['updates_since_full_refit'] + 1
+
 # Function for training the model
-def train_model(dataset_csv_path, model_path, output_data_file, output_model_file):
+def train_model(dataset_csv_path, model_path, output_data_file, output_model_file, mode=None, deployed_model_path=None):
+    """Train on the consolidated dataset and pickle the model to model_path.
+
+    ``mode`` (default: config ``training_mode``) is 'full' for a fresh fit on
+    every row, or 'incremental' to update the deployed model with only the rows
+    it hasn't seen; every ``full_refit_every`` incremental updates a full refit
+    runs instead.
+    """
     try:
         logging.info("Starting model training...")
-        
-        #use this logistic regression for training
-        model = LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
-                        intercept_scaling=1, l1_ratio=None, max_iter=100,
-                        multi_class='auto', n_jobs=None, penalty='l2',
-                        random_state=0, solver='liblinear', tol=0.0001, verbose=0,
-                        warm_start=False)
-        
-        #load the finaldata.csv
-        data = pd.read_csv(dataset_csv_path)
-        logging.info(f"Loaded data from {dataset_csv_path}")
+        mode = mode or config.get('training_mode', 'full')
+        if deployed_model_path is None:
+            deployed_model_path = os.path.join(config['prod_deployment_path'], output_model_file)
+        data_format = config.get('dataset_format', 'csv')
+        params = None
+        if config.get('use_tuned_params', False):
+            from tuning import load_best_params
+            params = load_best_params(os.path.dirname(model_path))
+        if params:
+            logging.info(f"Using tuned hyperparameters {params}")
 
-        #define your X and y
-        X = data.drop(columns=['corporation', 'exited'], axis=1)
-        y = data['exited']
+        result = None
+        if mode == 'incremental':
+            # Whole rows are needed to tell new rows from ones the deployed model has seen
+            data = dataset.read_dataset(dataset_csv_path, data_format=data_format)
+            logging.info(f"Loaded data from {dataset_csv_path}")
+            hashes = ingestion.row_hashes(data)
+            start = time.perf_counter()
+            result = _incremental_model(data, hashes, deployed_model_path, config.get('full_refit_every', 5))
+            incremental_seconds = time.perf_counter() - start
+        else:
+            #load the finaldata.csv (or its Parquet copy), only the columns the model needs
+            data = dataset.read_dataset(dataset_csv_path, columns=FEATURE_COLUMNS + ['exited'],
+                                        data_format=data_format)
+            logging.info(f"Loaded data from {dataset_csv_path}")
 
-        #split the data into training and testing set
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        logging.info("Data split into training and testing sets")
-        
-        #fit the logistic regression to your data
-        model.fit(X_train, y_train)
+        if result is not None:
+            model, trained_rows, updates = result
+            if config.get('compare_full_refit', True):
+                # What the shortcut costs: time and holdout accuracy against a full refit
+                start = time.perf_counter()
+                full_model = fit_full_model(data, params)
+                full_seconds = time.perf_counter() - start
+                accuracy, full_accuracy = _holdout_accuracy(model), _holdout_accuracy(full_model)
+                logging.info(f"Incremental update took {incremental_seconds:.3f}s vs {full_seconds:.3f}s for a full refit; "
+                             f"holdout accuracy {accuracy:.4f} vs {full_accuracy:.4f} (delta {accuracy - full_accuracy:+.4f})")
+            else:
+                logging.info(f"Incremental update took {incremental_seconds:.3f}s")
+        else:
+            start = time.perf_counter()
+            model = fit_full_model(data, params)
+            logging.info(f"Full refit took {time.perf_counter() - start:.3f}s")
+            if mode == 'incremental':
+                # A full fit has seen every row currently in the dataset
+                trained_rows = ingestion.load_row_index(
+                    os.path.join(os.path.dirname(dataset_csv_path), ingestion.ROW_INDEX_FILE),
+                    dataset_csv_path, data_format)
+            updates = 0
         logging.info("Model training completed")
         
         #create output directory if it doesn't exist
@@ -51,6 +193,19 @@ def train_model(dataset_csv_path, model_path, output_data_file, output_model_fil
         with open(model_path, 'wb') as file:
             pickle.dump(model, file)
         logging.info(f"Model saved to {model_path}")
+
+        # Deployment copies these with the model, so the next incremental run knows what it has seen
+        state_paths = [os.path.join(os.path.dirname(model_path), name) for name in (TRAINED_ROWS_FILE, TRAINING_STATE_FILE)]
+        if mode == 'incremental':
+            np.save(state_paths[0], np.unique(trained_rows))
+            with open(state_paths[1], 'w') as f:
+                json.dump({'last_fit': 'incremental' if result is not None else 'full', 'updates_since_full_refit': updates,
+                           'trained_rows': int(len(np.unique(trained_rows)))}, f, indent=4)
+        else:
+            # Full mode keeps no row bookkeeping; state left by an earlier incremental run no longer describes this model
+            for path in state_paths:
+                if os.path.exists(path):
+                    os.remove(path)
             
         return model
         
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import logging
+import settings
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, StratifiedKFold
+import dataset
+import training
+from inference import FEATURE_COLUMNS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Search results, written next to the trained model
+BEST_CONFIG_FILE = 'bestconfig.json'
+LEADERBOARD_FILE = 'leaderboard.csv'
+
+# liblinear takes l1 and l2; lbfgs only l2, so the grid is split by solver
+PARAM_GRID = [
+    {'solver': ['liblinear'], 'penalty': ['l1', 'l2'],
+     'C': [0.01, 0.1, 1.0, 10.0, 100.0], 'class_weight': [None, 'balanced']},
+    {'solver': ['lbfgs'], 'penalty': ['l2'],
+     'C': [0.01, 0.1, 1.0, 10.0, 100.0], 'class_weight': [None, 'balanced']}
+]
+
+
+def cv_splits(y, folds=5, random_state=0):
+    """Stratified k-fold indices, computed once and reused by every candidate"""
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state)
+    return list(splitter.split(np.zeros(len(y)), y))
+
+
+def make_search(search='grid', splits=None, n_jobs=-1, scoring='f1', n_iter=10, random_state=0):
+    """GridSearchCV, RandomizedSearchCV or HalvingGridSearchCV (successive halving) over PARAM_GRID"""
+    # The estimator training.py fits, so candidates are scored under the production solver settings
+    estimator = training.make_model()
+    if search == 'halving':
+        # Successive halving is still experimental in scikit-learn and must be enabled explicitly
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingGridSearchCV
+        return HalvingGridSearchCV(estimator, PARAM_GRID, cv=splits, scoring=scoring, n_jobs=n_jobs,
+                                   random_state=random_state)
+    if search == 'random':
+        return RandomizedSearchCV(estimator, PARAM_GRID, n_iter=n_iter, cv=splits, scoring=scoring,
+                                  n_jobs=n_jobs, random_state=random_state)
+    if search == 'grid':
+        return GridSearchCV(estimator, PARAM_GRID, cv=splits, scoring=scoring, n_jobs=n_jobs)
+    raise ValueError(f"Unknown search: {search}")
+
+
+def leaderboard(cv_results):
+    results = pd.DataFrame(cv_results)
+    columns = ['rank_test_score', 'mean_test_score', 'std_test_score', 'mean_fit_time', 'params']
+    if 'iter' in results:
+        # Halving: each candidate appears once per round it survived; keep its last round and
+        # rank candidates that went further first, then by score within the round
+        results = results.sort_values('iter').drop_duplicates(subset='params', keep='last')
+        results = results.sort_values(['iter', 'mean_test_score'], ascending=[False, False])
+        results['rank_test_score'] = np.arange(1, len(results) + 1)
+        columns.insert(1, 'iter')
+    results['params'] = results['params'].apply(lambda params: json.dumps(params, sort_keys=True))
+    return results[columns].sort_values(['rank_test_score', 'mean_fit_time']).reset_index(drop=True)
+
+
+# Function to search hyperparameters with cross-validation
+def tune_model(dataset_csv_path, output_model_path, search='grid', folds=5, n_jobs=-1, n_iter=10,
+               scoring='f1', data_format='csv'):
+    """Cross-validated search over C, penalty, solver and class_weight.
+
+    Candidates are fitted on a joblib process pool (``n_jobs=-1`` uses every
+    core). The winning config and the full leaderboard are written to
+    bestconfig.json and leaderboard.csv in output_model_path.
+    """
+    try:
+        data = dataset.read_dataset(dataset_csv_path, columns=FEATURE_COLUMNS + ['exited'], data_format=data_format)
+        X = data[FEATURE_COLUMNS]
+        y = data['exited']
+        splits = cv_splits(y, folds)
+        logging.info(f"Tuning with {search} search, {folds}-fold CV on {len(data)} rows")
+
+        start = time.perf_counter()
+        searcher = make_search(search, splits, n_jobs, scoring, n_iter)
+        searcher.fit(X, y)
+        seconds = time.perf_counter() - start
+
+        board = leaderboard(searcher.cv_results_)
+        best = {
+            'params': searcher.best_params_,
+            'score': float(searcher.best_score_),
+            'scoring': scoring,
+            'search': search,
+            'folds': folds,
+            'candidates': int(len(board)),
+            'seconds': seconds
+        }
+        os.makedirs(output_model_path, exist_ok=True)
+        with open(os.path.join(output_model_path, BEST_CONFIG_FILE), 'w') as f:
+            json.dump(best, f, indent=4)
+        board.to_csv(os.path.join(output_model_path, LEADERBOARD_FILE), index=False)
+        logging.info(f"Best {scoring} {best['score']:.4f} with {best['params']} "
+                     f"({best['candidates']} candidates in {seconds:.2f}s)")
+        return best
+    except Exception as e:
+        logging.error(f"Error in tuning: {str(e)}")
+        return None
+
+
+def load_best_params(output_model_path):
+    """The tuned LogisticRegression params, or None if no search has been run"""
+    best_config_path = os.path.join(output_model_path, BEST_CONFIG_FILE)
+    if not os.path.exists(best_config_path):
+        return None
+    with open(best_config_path, 'r') as f:
+        return json.load(f)['params']
+
+
+if __name__ == '__main__':
+    config = settings.get_config()
+
+    tune_model(
+        os.path.join(config['output_folder_path'], config['output_data_file']),
+        config['output_model_path'],
+        search=config.get('tuning_search', 'grid'),
+        folds=config.get('tuning_folds', 5),
+        n_jobs=config.get('tuning_jobs', -1),
+        n_iter=config.get('tuning_iterations', 10),
+        data_format=config.get('dataset_format', 'csv')
+    )
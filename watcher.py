@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+# Names that uploaders commonly use while a file is still being written
+PARTIAL_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '.filepart')
+
+
+def is_candidate(name):
+    """A finished source file: a visible .csv that isn't an in-progress upload name"""
+    return name.endswith('.csv') and not name.startswith('.') and not name.endswith(PARTIAL_SUFFIXES)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify for one directory"""
+    def __init__(self, path):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or libc_name is None:
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def read(self, timeout):
+        """Names touched within ``timeout`` seconds (None on queue overflow, meaning 'rescan')"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            if name:
+                names.add(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SourceWatcher:
+    """Waits for batches of complete, not-yet-processed CSV files in a directory.
+
+    Uses inotify where available and falls back to polling directory stats.
+    A file counts as complete once it has a final name (no temp suffix or
+    leading dot) and its size/mtime haven't moved for ``settle_seconds``.
+    Arrivals are debounced: a batch is released ``debounce_seconds`` after the
+    last change (or after ``max_wait_seconds`` of continuous activity).
+    """
+    def __init__(self, input_folder_path, processed=None, debounce_seconds=2.0, settle_seconds=1.0,
+                 poll_interval=1.0, max_wait_seconds=60.0, use_inotify=True):
+        self.input_folder_path = input_folder_path
+        self.processed = dict(processed or {})
+        self.debounce_seconds = debounce_seconds
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.max_wait_seconds = max_wait_seconds
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify(input_folder_path)
+                logging.info(f"Watching {input_folder_path} with inotify")
+            except OSError as e:
+                logging.info(f"inotify unavailable ({str(e)}), polling {input_folder_path}")
+
+    def _pending(self):
+        # Files whose current signature hasn't been handed out in a batch yet
+        pending = {}
+        for name in os.listdir(self.input_folder_path):
+            if not is_candidate(name):
+                continue
+            try:
+                signature = file_signature(os.path.join(self.input_folder_path, name))
+            except FileNotFoundError:
+                continue
+            if self.processed.get(name) != signature:
+                pending[name] = signature
+        return pending
+
+    def _wait_for_change(self, timeout):
+        if self._inotify is not None:
+            names = self._inotify.read(timeout)
+            return names is None or any(is_candidate(name) for name in names)
+        time.sleep(timeout)
+        return False
+
+    def wait_for_batch(self):
+        """Block until a settled batch of new or changed files exists; return {name: signature}"""
+        while True:
+            pending = self._pending()
+            if not pending:
+                self._wait_for_change(self.poll_interval)
+                continue
+
+            # Debounce: keep absorbing arrivals until the directory goes quiet
+            started = time.monotonic()
+            quiet_since = time.monotonic()
+            while time.monotonic() - quiet_since < self.debounce_seconds:
+                if time.monotonic() - started > self.max_wait_seconds:
+                    break
+                changed = self._wait_for_change(min(self.poll_interval, self.debounce_seconds))
+                current = self._pending()
+                if changed or current != pending:
+                    pending = current
+                    quiet_since = time.monotonic()
+
+            # Settle: only files whose size and mtime hold still are complete
+            time.sleep(self.settle_seconds)
+            settled = {name: signature for name, signature in self._pending().items()
+                       if pending.get(name) == signature}
+            if settled:
+                return settled
+
+    def mark_processed(self, batch):
+        self.processed.update(batch)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None